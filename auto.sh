@@ -1,4 +1,4 @@
-COMMAND="python poker_hands.py"
+COMMAND="python poker_hands.py --cache poker-hands-cache.sqlite"
 ${COMMAND}
 watchmedo shell-command --patterns="*.py;*.jinja" \
     --command="${COMMAND}" \
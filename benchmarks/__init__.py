@@ -0,0 +1,12 @@
+"""Benchmarks for poker_hands.py.
+
+The hand histories are generated, see benchmarks.synthetic, so that the size
+and shape of the input can be controlled. Run the benchmarks from the root of
+the repository (so that the template can be found) with:
+
+    python -m benchmarks.run --output results.json
+
+and compare against an earlier run with:
+
+    python -m benchmarks.run --compare results.json
+"""
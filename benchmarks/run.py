@@ -0,0 +1,286 @@
+"""Times each stage of compiling a poker hands file, and the whole thing end
+to end, on synthetic hand histories.
+
+The results are written as json, and can be compared with those of an earlier
+run, in which case any stage which has slowed down by more than the threshold
+is reported and the exit status is non-zero.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import poker_hands
+from benchmarks import synthetic
+
+
+def clear_memos():
+    """Empties the memo shared across hands, so that each repetition does the
+    same work rather than finding the results of the previous one."""
+    poker_hands.EQUITY_MEMO.clear()
+
+
+def best_time(function, repeat):
+    """Runs the function `repeat` times, and returns the fastest time, along
+    with the result of the last run."""
+    times = []
+    for _ in range(repeat):
+        clear_memos()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+class Benchmark(object):
+    def __init__(self, hands, settings, equity_settings, repeat, directory):
+        self.number_of_hands = hands
+        self.settings = settings
+        self.equity_settings = equity_settings
+        self.repeat = repeat
+        self.csv_filename = os.path.join(directory, 'synthetic.csv')
+        self.html_filename = os.path.join(directory, 'synthetic.html')
+        self.snapshot_filename = os.path.join(directory, 'synthetic.snapshot')
+        self.directory = directory
+        synthetic.write_csv(self.csv_filename, hands, settings)
+        # So that the first stage run does not also time loading them.
+        poker_hands.load_tables()
+        self.rows = self.read_rows()
+        self.results = {}
+        self.calculated_hands = None
+
+    def record(self, name, function, items):
+        seconds, result = best_time(function, self.repeat)
+        self.record_time(name, seconds, items)
+        return result
+
+    def record_time(self, name, seconds, items):
+        per_second = items / seconds if seconds else None
+        self.results[name] = {
+            'seconds': seconds,
+            'items': items,
+            'per_second': per_second,
+            }
+        print("{:<12} {:>10.4f}s {:>12.1f}/s".format(name, seconds, per_second or 0))
+
+    def read_rows(self):
+        with open(self.csv_filename, 'r', encoding='utf-8', errors='ignore') as input_file:
+            return list(poker_hands.read_rows(input_file))
+
+    def random_hands(self, number):
+        rng = random.Random(self.settings.seed)
+        return [rng.sample(range(52), 7) for _ in range(number)]
+
+    def run_evaluate(self):
+        hands = self.random_hands(20000)
+
+        def evaluate():
+            for cards in hands:
+                poker_hands.hand_strength(cards)
+        self.record('evaluate', evaluate, len(hands))
+
+        pockets_and_boards = [([poker_hands.CARDS[c] for c in cards[:2]],
+                               [poker_hands.CARDS[c] for c in cards[2:]]) for cards in hands]
+
+        def best_hands():
+            for pocket, board in pockets_and_boards:
+                poker_hands.best_hand(pocket, board)
+        self.record('best_hand', best_hands, len(hands))
+
+    def run_equity(self):
+        """Exhaustive flop equity for random states with three players."""
+        rng = random.Random(self.settings.seed)
+        states = []
+        for _ in range(20):
+            cards = rng.sample(poker_hands.CARDS, 9)
+            hand = poker_hands.PokerHand(self.equity_settings)
+            hand.flop = cards[6:]
+            players = []
+            for index in range(3):
+                player = poker_hands.Player(index + 1)
+                player.pocket = tuple(cards[2 * index:2 * index + 2])
+                players.append(player)
+            states.append((hand, players))
+
+        def equity():
+            for hand, players in states:
+                poker_hands.HandEquity(hand).calculate(players)
+        self.record('equity', equity, len(states))
+
+    def run_read(self):
+        """Reading the csv file into rows, the items are rows."""
+        self.record('read', self.read_rows, len(self.rows))
+
+    def run_headers(self):
+        def headers():
+            return list(poker_hands.read_poker_headers(self.csv_filename))
+        self.record('headers', headers, len(self.rows))
+
+    def run_parse(self):
+        def parse():
+            return [poker_hands.parse_hand(row, self.equity_settings, calculate=False)
+                    for row in self.rows]
+        self.record('parse', parse, len(self.rows))
+
+    def run_calculate(self):
+        def calculate():
+            hands = [poker_hands.parse_hand(row, self.equity_settings, calculate=False)
+                     for row in self.rows]
+            hands = [hand for hand in hands if hand is not None]
+            start = time.perf_counter()
+            for hand in hands:
+                hand.calculate_hand()
+            return time.perf_counter() - start, hands
+        # Only the calculation itself is timed, not the parsing needed to
+        # give each repetition fresh hands.
+        times = []
+        for _ in range(self.repeat):
+            clear_memos()
+            seconds, hands = calculate()
+            times.append(seconds)
+        self.record_time('calculate', min(times), len(hands))
+        self.calculated_hands = hands
+
+    def ensure_calculated_hands(self):
+        if self.calculated_hands is None:
+            self.calculated_hands = [hand for hand in (
+                poker_hands.parse_hand(row, self.equity_settings) for row in self.rows) if hand]
+
+    def run_snapshot(self):
+        """Loading every hand from a snapshot, rather than parsing and
+        calculating them."""
+        self.ensure_calculated_hands()
+        writer = poker_hands.SnapshotWriter()
+        for hand in self.calculated_hands:
+            writer.add_hand(hand)
+        writer.write(self.snapshot_filename)
+
+        def load():
+            snapshot = poker_hands.Snapshot(self.snapshot_filename)
+            hands = list(snapshot.hands())
+            snapshot.close()
+            return hands
+        self.record('snapshot', load, len(self.calculated_hands))
+
+    def run_render(self):
+        self.ensure_calculated_hands()
+        env = poker_hands.get_template_environment()
+        template = env.get_template('poker-hands.jinja')
+
+        def render():
+            output = io.StringIO()
+            stream = template.stream(poker_hands=self.calculated_hands,
+                                     input_filename=self.csv_filename,
+                                     date=datetime.date.today())
+            stream.enable_buffering(poker_hands.DEFAULT_BUFFER_SIZE)
+            stream.dump(output)
+        self.record('render', render, len(self.calculated_hands))
+
+    def run_startup(self):
+        """The wall time of fresh processes, first just importing poker_hands
+        and then compiling a file of a few hands, which is mostly the cost of
+        starting up. The caches persisting between runs are warm after the
+        first repetition, so these are the times of a typical run."""
+        def importing():
+            subprocess.run([sys.executable, '-c', 'import poker_hands'], check=True)
+        self.record('import', importing, 1)
+
+        small_csv_filename = os.path.join(self.directory, 'small.csv')
+        small_html_filename = os.path.join(self.directory, 'small.html')
+        synthetic.write_csv(small_csv_filename, 5, self.settings)
+
+        def compiling():
+            subprocess.run([sys.executable, poker_hands.__file__, small_csv_filename, small_html_filename,
+                            '--samples', str(self.equity_settings.max_samples)],
+                           check=True, stdout=subprocess.DEVNULL)
+        self.record('startup', compiling, 5)
+
+    def run_end_to_end(self):
+        def end_to_end():
+            poker_hands.compile_poker_hands_html(self.csv_filename, self.html_filename,
+                                                 self.equity_settings)
+        self.record('end_to_end', end_to_end, self.number_of_hands)
+
+    def run(self, stages):
+        for stage in stages:
+            getattr(self, 'run_' + stage)()
+        return self.results
+
+
+STAGES = ['evaluate', 'equity', 'read', 'headers', 'parse', 'calculate', 'snapshot', 'render', 'end_to_end',
+          'startup']
+
+
+def compare(results, previous, threshold):
+    """Returns a list of the stages which are slower than in the previous
+    results by more than the threshold, a proportion."""
+    regressions = []
+    for name, result in results['stages'].items():
+        before = previous['stages'].get(name)
+        if not before:
+            continue
+        change = result['seconds'] / before['seconds'] - 1
+        marker = ''
+        if change > threshold:
+            regressions.append(name)
+            marker = '  REGRESSION'
+        print("{:<12} {:>10.4f}s -> {:>10.4f}s {:>+8.1%}{}".format(
+            name, before['seconds'], result['seconds'], change, marker))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark poker_hands.py on synthetic hands.")
+    synthetic.add_settings_arguments(parser)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Each stage is run this many times and the fastest taken.")
+    parser.add_argument('--samples', type=int, default=2000,
+                        help="The maximum number of samples used for preflop equity.")
+    parser.add_argument('--hidden-hands', default=None,
+                        help="The range of the hands of the players who do not show, see poker_hands.parse_hand_range.")
+    parser.add_argument('--output', default=None, help="Write the results as json to this file.")
+    parser.add_argument('--compare', default=None, help="Compare with the results in this json file.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="The proportion by which a stage may slow down before it is a regression.")
+    arguments = parser.parse_args(argv)
+
+    settings = synthetic.settings_from_arguments(arguments)
+    equity_settings = poker_hands.EquitySettings(max_samples=arguments.samples,
+                                                 hidden_hands=arguments.hidden_hands)
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark = Benchmark(arguments.hands, settings, equity_settings, arguments.repeat, directory)
+        stages = benchmark.run(arguments.stages)
+
+    results = {
+        'settings': dict(vars(settings), hands=arguments.hands, samples=arguments.samples,
+                         hidden_hands=arguments.hidden_hands),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': poker_hands.use_numpy(),
+            'platform': platform.platform(),
+            },
+        'stages': stages,
+        }
+    if arguments.output:
+        with open(arguments.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as infile:
+            previous = json.load(infile)
+        if previous.get('settings') != results['settings']:
+            print("Warning: the previous results were produced with different settings.")
+        if compare(results, previous, arguments.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""Generates synthetic hand histories in the csv layout read by parse_hand.
+
+The betting is not meant to be realistic poker, but every hand generated is
+valid, that is, it can be parsed and calculated without errors, and the
+settings control the proportion of hands which reach each street and how
+often players go all in, since those decide how much work calculating a hand
+involves.
+"""
+import argparse
+import csv
+import random
+
+import poker_hands
+
+HEADER = ["// Hand Start", "Hand Title", "Ante Amt", "SB Amt", "BB Amt", "Dealer Player#",
+          "SB Player#", "BB Player#"]
+for _player in range(1, poker_hands.NUMBER_OF_SEATS + 1):
+    HEADER.extend("Player {} {}".format(_player, column) for column in ["Name", "Straddle", "Cards", "Stack"])
+for _event in range(10):
+    HEADER.extend(["Event Start", "Event Type", "Event Player#", "Event Card", "Event Amt"])
+
+# The exporter pads every row with empty columns up to this width.
+ROW_WIDTH = 191
+
+NAMES = ["CARROLL", "CANTU", "BRUNSON", "HELLMUTH", "PHILLIPS", "HALL", "IMEJJANE",
+         "GARDNER", "RITACCO", "NEGREANU"]
+
+FLOP, TURN, RIVER = 1, 2, 3
+
+
+class SyntheticSettings(object):
+    """`flop_rate` is the proportion of hands which reach the flop, and
+    `turn_rate` and `river_rate` the proportions of those reaching the previous
+    street which go on to the next. `all_in_rate` is the chance of any one
+    action being an all in, and any hand with an all in is played out to the
+    river. `show_rate` is the chance of a player's cards being recorded."""
+    def __init__(self, players=6, flop_rate=0.5, turn_rate=0.7, river_rate=0.7,
+                 all_in_rate=0.02, fold_rate=0.3, raise_rate=0.15, show_rate=0.9,
+                 small_blind=25, big_blind=50, starting_stack=10000, seed=0):
+        assert 2 <= players <= poker_hands.NUMBER_OF_SEATS
+        self.players = players
+        self.flop_rate = flop_rate
+        self.turn_rate = turn_rate
+        self.river_rate = river_rate
+        self.all_in_rate = all_in_rate
+        self.fold_rate = fold_rate
+        self.raise_rate = raise_rate
+        self.show_rate = show_rate
+        self.small_blind = small_blind
+        self.big_blind = big_blind
+        self.starting_stack = starting_stack
+        self.seed = seed
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+class SyntheticHand(object):
+    def __init__(self, settings, rng, number, starting_seconds):
+        self.settings = settings
+        self.rng = rng
+        self.number = number
+        self.starting_seconds = starting_seconds
+        self.clock = starting_seconds
+        self.events = []
+
+    def emit(self, action, seat='', card='', amount=''):
+        self.clock += self.rng.randint(1, 6)
+        self.events.append([format_time(self.clock), action, str(seat), card, str(amount)])
+
+    def choose_last_street(self):
+        rng = self.rng
+        settings = self.settings
+        if rng.random() >= settings.flop_rate:
+            return 0
+        if rng.random() >= settings.turn_rate:
+            return FLOP
+        if rng.random() >= settings.river_rate:
+            return TURN
+        return RIVER
+
+    def row(self):
+        settings = self.settings
+        rng = self.rng
+        seats = list(range(1, settings.players + 1))
+        dealer = seats[self.number % len(seats)]
+
+        def following(seat):
+            return seats[seat % len(seats)]
+
+        small_blind_seat = following(dealer)
+        big_blind_seat = following(small_blind_seat)
+
+        # Stacks are kept in whole small blinds.
+        stacks = {seat: settings.small_blind * rng.randint(
+                      settings.starting_stack // (2 * settings.small_blind),
+                      2 * settings.starting_stack // settings.small_blind)
+                  for seat in seats}
+        starting_stacks = dict(stacks)
+        invested = {seat: 0 for seat in seats}
+        for seat, blind in [(small_blind_seat, settings.small_blind),
+                            (big_blind_seat, settings.big_blind)]:
+            invested[seat] = blind
+            stacks[seat] -= blind
+
+        deck = [str(card) for card in poker_hands.CARDS]
+        rng.shuffle(deck)
+        pockets = {seat: [deck.pop(), deck.pop()] for seat in seats}
+
+        self.stacks = stacks
+        self.invested = invested
+        self.live = list(seats)
+        self.all_in = set()
+        last_street = self.choose_last_street()
+
+        preflop_order = seats[seats.index(big_blind_seat) + 1:] + seats[:seats.index(big_blind_seat) + 1]
+        postflop_order = seats[seats.index(small_blind_seat):] + seats[:seats.index(small_blind_seat)]
+        for street in range(RIVER + 1):
+            if street:
+                for _card in range(3 if street == FLOP else 1):
+                    self.emit('BOARD', card=deck.pop())
+            order = preflop_order if street == 0 else postflop_order
+            if street == last_street and street != RIVER and not self.all_in:
+                self.end_betting(order)
+                break
+            self.betting_round(order)
+            if self.all_in:
+                # An all in player cannot fold, so the hand must be played
+                # out to the river.
+                last_street = RIVER
+
+        shown = {seat: rng.random() < settings.show_rate for seat in seats}
+        title = "Hand {:03d} - {}".format(self.number, ", ".join(
+            "{} {}".format(NAMES[seat - 1], " ".join(pockets[seat])) for seat in seats if shown[seat]))
+        row = [format_time(self.starting_seconds), title, "0", str(settings.small_blind),
+               str(settings.big_blind), str(dealer), str(small_blind_seat), str(big_blind_seat)]
+        for seat in range(1, poker_hands.NUMBER_OF_SEATS + 1):
+            if seat in seats:
+                cards = " ".join(pockets[seat]) if shown[seat] else ""
+                row.extend([NAMES[seat - 1], "0", cards, str(starting_stacks[seat])])
+            else:
+                row.extend(["SEAT {}".format(seat), "0", "", "0"])
+        for event in self.events:
+            row.extend(event)
+        row.extend([""] * (ROW_WIDTH - len(row)))
+        return row
+
+    def acting(self, order):
+        return [seat for seat in order if seat in self.live and seat not in self.all_in]
+
+    def price(self):
+        return max(self.invested.values())
+
+    def put_in(self, seat, amount):
+        self.invested[seat] += amount
+        self.stacks[seat] -= amount
+
+    def go_all_in(self, seat):
+        amount = self.stacks[seat]
+        self.emit('ALL_IN', seat, amount=amount)
+        self.put_in(seat, amount)
+        self.all_in.add(seat)
+
+    def fold(self, seat):
+        self.emit('FOLD', seat)
+        self.live.remove(seat)
+
+    def call_or_check(self, seat):
+        to_call = self.price() - self.invested[seat]
+        if to_call >= self.stacks[seat]:
+            self.go_all_in(seat)
+        elif to_call:
+            self.emit('CALL', seat, amount=to_call)
+            self.put_in(seat, to_call)
+        else:
+            self.emit('BET', seat, amount=0)
+
+    def bet(self, seat):
+        to_call = self.price() - self.invested[seat]
+        amount = to_call + self.settings.big_blind * self.rng.randint(2, 4)
+        if amount >= self.stacks[seat]:
+            self.go_all_in(seat)
+        else:
+            self.emit('BET', seat, amount=amount)
+            self.put_in(seat, amount)
+
+    def betting_round(self, order):
+        rng = self.rng
+        settings = self.settings
+        for seat in self.acting(order):
+            if len(self.acting(order)) < 2 and self.price() == self.invested[seat]:
+                break
+            to_call = self.price() - self.invested[seat]
+            choice = rng.random()
+            if choice < settings.all_in_rate:
+                self.go_all_in(seat)
+            elif choice < settings.all_in_rate + settings.fold_rate and to_call and len(self.live) > 2:
+                self.fold(seat)
+            elif choice < settings.all_in_rate + settings.fold_rate + settings.raise_rate:
+                self.bet(seat)
+            else:
+                self.call_or_check(seat)
+        # There is no re-raising, anyone who has not matched the last bet now
+        # calls or folds.
+        for seat in self.acting(order):
+            if self.invested[seat] < self.price():
+                if len(self.live) > 2 and rng.random() < settings.fold_rate:
+                    self.fold(seat)
+                else:
+                    self.call_or_check(seat)
+
+    def end_betting(self, order):
+        """The first to act bets and everyone else folds, ending the hand."""
+        acting = self.acting(order)
+        self.bet(acting[0])
+        for seat in acting[1:]:
+            self.fold(seat)
+
+
+def generate_rows(number_of_hands, settings=None):
+    """Yields the header row and then a row for each of the hands."""
+    settings = settings or SyntheticSettings()
+    rng = random.Random(settings.seed)
+    yield HEADER
+    seconds = 0
+    for number in range(1, number_of_hands + 1):
+        hand = SyntheticHand(settings, rng, number, seconds)
+        yield hand.row()
+        seconds = hand.clock + rng.randint(10, 60)
+
+
+def write_csv(filename, number_of_hands, settings=None):
+    with open(filename, 'w', newline='') as outfile:
+        writer = csv.writer(outfile, delimiter=',', quotechar='"')
+        writer.writerows(generate_rows(number_of_hands, settings))
+
+
+def add_settings_arguments(parser):
+    defaults = SyntheticSettings()
+    parser.add_argument('--hands', type=int, default=200, help="The number of hands generated.")
+    parser.add_argument('--players', type=int, default=defaults.players)
+    parser.add_argument('--flop-rate', type=float, default=defaults.flop_rate)
+    parser.add_argument('--turn-rate', type=float, default=defaults.turn_rate)
+    parser.add_argument('--river-rate', type=float, default=defaults.river_rate)
+    parser.add_argument('--all-in-rate', type=float, default=defaults.all_in_rate)
+    parser.add_argument('--show-rate', type=float, default=defaults.show_rate)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+def settings_from_arguments(arguments):
+    return SyntheticSettings(
+        players=arguments.players,
+        flop_rate=arguments.flop_rate,
+        turn_rate=arguments.turn_rate,
+        river_rate=arguments.river_rate,
+        all_in_rate=arguments.all_in_rate,
+        show_rate=arguments.show_rate,
+        seed=arguments.seed,
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic poker hands csv file.")
+    parser.add_argument('output_filename')
+    add_settings_arguments(parser)
+    arguments = parser.parse_args()
+    write_csv(arguments.output_filename, arguments.hands, settings_from_arguments(arguments))
@@ -1,11 +1,31 @@
 import csv
+import array
+import bisect
 import enum
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 import itertools
 import traceback
 import datetime
-
-import jinja2
+import functools
+import glob
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import pickle
+import random
+import struct
+import time
+import zlib
+
+import session_statistics
+
+# numpy, jinja2, multiprocessing, sqlite3 and the profilers are only imported
+# where they are first needed, since importing them all takes a noticeable
+# part of the time to start up, particularly as a frozen executable. numpy is
+# imported by use_numpy.
+numpy = None
 
 def parse_card(card):
     suit = card[-1]
@@ -17,15 +37,17 @@ def parse_card(card):
              'j': 11,
              'q': 12,
              'k': 13}.get(value, None) or int(value)
-    return value, suit
+    return CARDS[encode_card((value, suit))]
+
+SUITS = ['c', 'h', 'd', 's']
 
 def new_deck():
-    return [(value, suit) for value in range(2,15) for suit in ['c', 'h', 'd', 's']]
+    return [(value, suit) for value in range(2,15) for suit in SUITS]
 
 def parse_pocket(pocket):
     if not pocket.strip():
-        return []
-    return [parse_card(c) for c in pocket.strip().split(' ')]
+        return ()
+    return tuple(parse_card(c) for c in pocket.strip().split(' '))
 
 class HandClass(enum.IntEnum):
     # A player may not be obliged to display their cards at the showdown, but
@@ -42,136 +64,1115 @@ class HandClass(enum.IntEnum):
     four_of_a_kind = 8
     straight_flush = 9
 
+
+# The hand evaluator works on cards encoded as small integers rather than the
+# (value, suit) tuples used elsewhere. The value occupies the upper bits and
+# the suit the lower two, so that the encoding of new_deck() is range(52).
+def encode_card(card):
+    if isinstance(card, Card):
+        return int(card)
+    value, suit = card
+    return (value - 2) * 4 + SUITS.index(suit)
+
+def decode_card(code):
+    return (code >> 2) + 2, SUITS[code & 3]
+
+class Card(int):
+    """A card is its integer encoding, see encode_card, so that it can be used
+    directly by the hand evaluator. However it also unpacks as the (value, suit)
+    tuple used elsewhere, for example, by the template. There is only one
+    instance of each card, in CARDS."""
+    __slots__ = ()
+
+    @property
+    def value(self):
+        return (self >> 2) + 2
+
+    @property
+    def suit(self):
+        return SUITS[self & 3]
+
+    def __iter__(self):
+        return iter(decode_card(self))
+
+    def __repr__(self):
+        return "{}{}".format(CARD_VALUE_NAMES.get(self.value, self.value), self.suit)
+
+    __str__ = __repr__
+
+CARD_VALUE_NAMES = {14: 'a', 13: 'k', 12: 'q', 11: 'j'}
+CARDS = [Card(code) for code in range(52)]
+
+# The strength of a hand is a single integer which compares in the same way
+# as the hands themselves. The hand class occupies the top bits and beneath
+# that are up to five card values, four bits each, most significant first. So
+# for example two pair 8s and 4s with a 2 kicker is:
+# (two_pair << 20) | (8 << 16) | (4 << 12) | (2 << 8)
+# and will beat two pair 7s and 5s. Note that a wheel (a,2,3,4,5) is a
+# straight with a high card of 5, not 14.
+HAND_CLASS_SHIFT = 20
+
+def make_strength(hand_class, values):
+    strength = int(hand_class)
+    for index in range(5):
+        value = values[index] if index < len(values) else 0
+        strength = (strength << 4) | value
+    return strength
+
+def strength_hand_class(strength):
+    return HandClass(strength >> HAND_CLASS_SHIFT)
+
+def straight_high_card(mask):
+    """Given a bit mask of the values present (bit 0 being a 2), returns the
+    high card of the best straight contained within it, or 0 if there is none."""
+    for high in range(14, 5, -1):
+        straight_mask = 0b11111 << (high - 6)
+        if mask & straight_mask == straight_mask:
+            return high
+    wheel_mask = (1 << 12) | 0b1111
+    if mask & wheel_mask == wheel_mask:
+        return 5
+    return 0
+
+def mask_values(mask):
+    return [value for value in range(14, 1, -1) if mask & (1 << (value - 2))]
+
+def value_counts_strength(value_counts):
+    """The strength of the best five card hand made from cards with the given
+    values, assuming no flush. `value_counts` maps card values to how many
+    times they occur."""
+    # Ordered by count and *then* by value, so that a full house of 6s over 2s
+    # beats a full house of 3s over 10s.
+    groups = sorted(((count, value) for value, count in value_counts.items() if count), reverse=True)
+    mask = sum(1 << (value - 2) for _count, value in groups)
+    top_count, top_value = groups[0]
+    others = sorted((value for _count, value in groups[1:]), reverse=True)
+    if top_count == 4:
+        return make_strength(HandClass.four_of_a_kind, [top_value] + others[:1])
+    pair_values = [value for count, value in groups[1:] if count >= 2]
+    if top_count == 3 and pair_values:
+        return make_strength(HandClass.full_house, [top_value, max(pair_values)])
+    straight_high = straight_high_card(mask)
+    if straight_high:
+        return make_strength(HandClass.straight, [straight_high])
+    if top_count == 3:
+        return make_strength(HandClass.three_of_a_kind, [top_value] + others[:2])
+    if top_count == 2 and pair_values:
+        second_pair = pair_values[0]
+        kickers = [value for value in others if value != second_pair]
+        return make_strength(HandClass.two_pair, [top_value, second_pair] + kickers[:1])
+    if top_count == 2:
+        return make_strength(HandClass.pair, [top_value] + others[:3])
+    return make_strength(HandClass.high_card, [top_value] + others[:4])
+
+def flush_strength(mask):
+    """The strength of the best five card hand made from cards of a single
+    suit with the given values."""
+    straight_high = straight_high_card(mask)
+    if straight_high:
+        return make_strength(HandClass.straight_flush, [straight_high])
+    return make_strength(HandClass.flush, mask_values(mask)[:5])
+
+# The lookup tables used by hand_strength. Seven cards can only contain one
+# flush, and if they do it beats anything that is not also a straight flush,
+# so a hand is either looked up in the flush table by the values of the
+# flush suit, or in the rank table by the multiset of its values. The
+# multiset is keyed by adding 5 ** (value - 2) for each card, which is unique
+# since no value can occur more than four times.
+CARD_RANK_KEYS = [5 ** (code >> 2) for code in range(52)]
+CARD_VALUE_BITS = [1 << (code >> 2) for code in range(52)]
+
+def build_flush_table():
+    return [flush_strength(mask) if bin(mask).count('1') >= 5 else 0 for mask in range(1 << 13)]
+
+def build_rank_table():
+    table = {}
+    for values in itertools.combinations_with_replacement(range(2, 15), 7):
+        value_counts = defaultdict(int)
+        for value in values:
+            value_counts[value] += 1
+        if max(value_counts.values()) > 4:
+            continue
+        key = sum(5 ** (value - 2) for value in values)
+        table[key] = value_counts_strength(value_counts)
+    return table
+
+# Bump when the tables change, so that those cached by an earlier version
+# are not used.
+TABLES_VERSION = 2
+
+def cached_table(name, build):
+    """The table, a dict of ints to ints, as saved in the cache directory by an
+    earlier run, or if there is none, built and saved there. Building the rank
+    table takes most of a second, loading it a few milliseconds. The file is
+    the number of entries and a checksum of the rest, which are the keys
+    followed by the values, so that a truncated or corrupt file is rebuilt."""
+    directory = cache_directory()
+    if directory is None:
+        return build()
+    filename = os.path.join(directory, '{}-{}.bin'.format(name, TABLES_VERSION))
+    data = array.array('q')
+    try:
+        with open(filename, 'rb') as infile:
+            data.frombytes(infile.read())
+    except (OSError, ValueError):
+        data = None
+    if data and len(data) == 2 + 2 * data[0] and data[1] == zlib.crc32(data[2:].tobytes()):
+        half = 2 + data[0]
+        return dict(zip(data[2:half], data[half:]))
+    table = build()
+    entries = array.array('q', list(table) + list(table.values()))
+    data = array.array('q', [len(table), zlib.crc32(entries.tobytes())]) + entries
+    import tempfile
+    try:
+        # A file of its own for each process, since others may be building
+        # the same table at the same time.
+        descriptor, temporary_filename = tempfile.mkstemp(prefix=name + '-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as outfile:
+                data.tofile(outfile)
+            os.replace(temporary_filename, filename)
+        except OSError:
+            os.unlink(temporary_filename)
+            raise
+    except OSError:
+        pass
+    return table
+
+class LazyTable(dict):
+    """A lookup table which is only loaded, see cached_table, when it is first
+    looked up, so that programs which never evaluate a hand do not pay for it.
+    Once loaded, every valid key is present, so looking up is no slower than
+    for a plain dict."""
+    def __init__(self, name, build):
+        super().__init__()
+        self.name = name
+        self.build = build
+
+    def load(self):
+        if not self:
+            self.update(cached_table(self.name, self.build))
+
+    def __missing__(self, key):
+        if self:
+            raise KeyError(key)
+        self.load()
+        return self[key]
+
+FLUSH_TABLE = LazyTable('flush-table', lambda: dict(enumerate(build_flush_table())))
+RANK_TABLE = LazyTable('rank-table', build_rank_table)
+
+def hand_strength(cards):
+    """Returns the strength of the best five card hand made from the given
+    seven encoded cards, see make_strength."""
+    rank_key = 0
+    suit_masks = [0, 0, 0, 0]
+    for card in cards:
+        rank_key += CARD_RANK_KEYS[card]
+        suit_masks[card & 3] |= CARD_VALUE_BITS[card]
+    for mask in suit_masks:
+        strength = FLUSH_TABLE[mask]
+        if strength:
+            return strength
+    return RANK_TABLE[rank_key]
+
+def hand_strength_array(cards):
+    """The vectorised equivalent of hand_strength, given a numpy array with
+    one row of seven encoded cards per hand, returns an array of strengths."""
+    tables = numpy_tables()
+    rank_keys = tables['card_rank_keys'][cards].sum(axis=1)
+    strengths = tables['rank_strengths'][numpy.searchsorted(tables['rank_keys'], rank_keys)]
+    value_bits = tables['card_value_bits'][cards]
+    suits = cards & 3
+    for suit in range(4):
+        suit_mask = numpy.where(suits == suit, value_bits, 0).sum(axis=1)
+        flush = tables['flush_table'][suit_mask]
+        strengths = numpy.where(flush > 0, flush, strengths)
+    return strengths
+
+NUMPY_TABLES = {}
+
+def numpy_tables():
+    if not NUMPY_TABLES:
+        use_numpy()
+        FLUSH_TABLE.load()
+        RANK_TABLE.load()
+        rank_keys = sorted(RANK_TABLE)
+        NUMPY_TABLES.update(
+            card_rank_keys=numpy.array(CARD_RANK_KEYS, dtype=numpy.int64),
+            card_value_bits=numpy.array(CARD_VALUE_BITS, dtype=numpy.int64),
+            rank_keys=numpy.array(rank_keys, dtype=numpy.int64),
+            rank_strengths=numpy.array([RANK_TABLE[key] for key in rank_keys], dtype=numpy.int64),
+            flush_table=numpy.array([FLUSH_TABLE[mask] for mask in range(len(FLUSH_TABLE))], dtype=numpy.int64),
+            )
+    return NUMPY_TABLES
+
+def load_tables():
+    """Loads the lookup tables which evaluating hands needs, if they are not
+    already loaded."""
+    if use_numpy():
+        numpy_tables()
+    else:
+        FLUSH_TABLE.load()
+        RANK_TABLE.load()
+
+
 class HandRank(object):
-    def __init__(self, rank, value_counts):
-        self.rank = rank
-        # The self.values is tricky to get correct. We want to be able to compare
-        # hands simply by comparing their rank and if those are the same then
-        # compare their values. However we need to first compare the ranks of
-        # the cards of which are there most, for example we want a full house of
-        # 6s over 2s to beat a full house of 3s over 10s. However, we also need
-        # to sort over rank since we want a two pair 8s over 4s to beat two pair
-        # 7s over 5s. So the below will make sure that a full house of 3s over 10s
-        # is represented as:
-        # [(3, 3), (2, 10), (1, 8)] and 6s over 2s is represented as
-        # [(3, 6), (2, 2), (1,8)] because (3,6) is more than (3,3) the second
-        # hand wins. Simliarly 88,44,2 will beat 77,55,2 because their representations
-        # will be:
-        # [(2,8), (2,4), (1,2)]
-        # [(2,7), (2,5), (1,2)]
-        # Note that it is important that we sort first by count, but *then* by
-        # value, since if we did not we might end up with:
-        # [(2,4), (2,8), (1,2)] for the first hand which would *compare* lower
-        # than the second.
-        self.card_values = sorted([(count, rank) for rank, count in value_counts.items()], reverse=True)
+    """A view of a hand strength which is convenient for display."""
+    def __init__(self, strength):
+        self.strength = strength
+
+    @property
+    def rank(self):
+        return strength_hand_class(self.strength)
+
+    @property
+    def card_values(self):
+        """The values which decide between hands of the same class, most
+        significant first."""
+        values = [(self.strength >> shift) & 0xF for shift in range(16, -1, -4)]
+        return [value for value in values if value]
 
     def __eq__(self, other):
-        return (self.rank, self.card_values) == (other.rank, other.card_values)
+        return self.strength == other.strength
 
     def __le__(self, other):
-        return (self.rank, self.card_values) <= (other.rank, other.card_values)
+        return self.strength <= other.strength
 
     def __lt__(self, other):
-        return (self.rank, self.card_values) < (other.rank, other.card_values)
+        return self.strength < other.strength
+
+
+class LRUMemo(object):
+    """A mapping of at most `max_size` entries, which when full discards the
+    least recently used entry. It is shared by every hand calculated in the
+    process, and counts its hits and misses."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
 
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
 
-def best_hand(pocket, flop):
-    def get_value_counts(cards):
-        value_counts = defaultdict(int)
-        for value, _suit in cards:
-            value_counts[value] += 1
-        return value_counts
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def statistics(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries), 'max_size': self.max_size}
+
+# The exact win percentages of the players in a state, see HandEquity.
+EQUITY_MEMO = LRUMemo(4096)
+
+def memo_statistics():
+    return {'equities': EQUITY_MEMO.statistics()}
 
+def best_hand(pocket, flop):
     if len(pocket) != 2:
-        print(flop)
-        return HandRank(HandClass.not_shown, get_value_counts(flop))
+        return HandRank(make_strength(HandClass.not_shown, []))
     assert len(flop) == 5
+    return HandRank(hand_strength([encode_card(card) for card in list(pocket) + list(flop)]))
+
+
+class EquitySettings(object):
+    """Controls how win probabilities are estimated for states in which there
+    are too many runouts to enumerate them all, that is, before the flop.
+    Runouts are sampled until `max_samples` have been drawn, the standard
+    error of every player's percentage is at most `target_standard_error`, or
+    `time_budget` seconds have passed, whichever comes first. The samples are
+    drawn from a generator seeded by `seed` and the cards known at that point,
+    so the same hand always produces the same estimates, unless the time
+    budget is the limiting factor.
+
+    Heads up before the flop, the exact win probabilities are instead looked
+    up in the `preflop_table` file, if there is one, see PreflopTable.
+
+    By default the players who never show their hand are left out. If
+    `hidden_hands` is given, a range as understood by parse_hand_range, they
+    are instead taken to hold any hand in that range, see
+    HandEquity.deal_hidden_hands."""
+    def __init__(self, max_samples=10000, target_standard_error=1.0,
+                 time_budget=0.25, seed=0, min_samples=1000, batch_size=500,
+                 preflop_table='preflop-equity.bin', hidden_hands=None):
+        self.max_samples = max_samples
+        self.target_standard_error = target_standard_error
+        self.time_budget = time_budget
+        self.seed = seed
+        # With very few samples a player that has won none, or all, of them
+        # would have a standard error of zero, so we always take at least this
+        # many.
+        self.min_samples = min_samples
+        self.batch_size = batch_size
+        self.preflop_table = preflop_table
+        self.hidden_hands = hidden_hands
+
+DEFAULT_EQUITY_SETTINGS = EquitySettings()
+
+
+# Players are identified by their seat, from 1 to NUMBER_OF_SEATS.
+NUMBER_OF_SEATS = 10
+
+class WinProbabilities(object):
+    """Maps player indexes to the percentage of runouts which that player
+    wins (or ties). If the percentages were estimated from a sample of the
+    runouts then `margins` maps player indexes to the half-width of a 95%
+    confidence interval, otherwise it is None. The percentages are held in an
+    array with a slot per seat, NaN for the players not included, but this can
+    be used like a read-only dict."""
+    __slots__ = ('percentages', 'margins', 'samples')
+
+    def __init__(self, percentages, margins=None, samples=None):
+        self.percentages = self.seat_array(percentages)
+        self.margins = None if margins is None else self.seat_array(margins)
+        self.samples = samples
+
+    @classmethod
+    def from_seat_arrays(cls, percentages, margins=None, samples=None):
+        win_probabilities = cls.__new__(cls)
+        win_probabilities.percentages = percentages
+        win_probabilities.margins = margins
+        win_probabilities.samples = samples
+        return win_probabilities
+
+    @staticmethod
+    def seat_array(values):
+        seats = array.array('d', [math.nan]) * NUMBER_OF_SEATS
+        for player_index, value in values.items():
+            seats[player_index - 1] = value
+        return seats
 
-    possible_hands = [
-        # Using no pocket cards
-        [flop[0], flop[1], flop[2], flop[3], flop[4]],
-        # Using first pocket card,
-        [pocket[0], flop[0], flop[1], flop[2], flop[3]],
-        [pocket[0], flop[0], flop[1], flop[2], flop[4]],
-        [pocket[0], flop[0], flop[1], flop[3], flop[4]],
-        [pocket[0], flop[0], flop[2], flop[3], flop[4]],
-        [pocket[0], flop[1], flop[2], flop[3], flop[4]],
-        # Using the second pocket card
-        [pocket[1], flop[0], flop[1], flop[2], flop[3]],
-        [pocket[1], flop[0], flop[1], flop[2], flop[4]],
-        [pocket[1], flop[0], flop[1], flop[3], flop[4]],
-        [pocket[1], flop[0], flop[2], flop[3], flop[4]],
-        [pocket[1], flop[1], flop[2], flop[3], flop[4]],
-
-        # Using both pocket cards
-        [pocket[0], pocket[1], flop[0], flop[1], flop[2]],
-        [pocket[0], pocket[1], flop[0], flop[1], flop[3]],
-        [pocket[0], pocket[1], flop[0], flop[2], flop[3]],
-        [pocket[0], pocket[1], flop[1], flop[2], flop[3]],
-
-        [pocket[0], pocket[1], flop[0], flop[1], flop[4]],
-        [pocket[0], pocket[1], flop[0], flop[2], flop[4]],
-        [pocket[0], pocket[1], flop[1], flop[2], flop[4]],
-
-        [pocket[0], pocket[1], flop[0], flop[3], flop[4]],
-        [pocket[0], pocket[1], flop[1], flop[3], flop[4]],
-
-        [pocket[0], pocket[1], flop[2], flop[3], flop[4]],
-        ]
-
-    def hand_rank(cards):
-        suits = set([suit for _v, suit in cards])
-        flush = len(suits) == 1
-        values = [value for value, _s in cards]
-        straight = False
-        for start in range(2, 11):
-            if all(i in values for i in range(start, start+5)):
-                straight = True
-                break
-        else:
-            straight = all(i in values for i in [14, 2, 3, 4, 5])
+    @property
+    def estimated(self):
+        return self.margins is not None
 
-        value_counts = get_value_counts(cards)
+    def interval(self, player_index):
+        percentage = self[player_index]
+        margin = self.margins[player_index - 1] if self.margins else 0.0
+        return max(0.0, percentage - margin), min(100.0, percentage + margin)
 
-        if flush and straight:
-            return HandRank(HandClass.straight_flush, value_counts)
+    def keys(self):
+        return [seat + 1 for seat, value in enumerate(self.percentages) if not math.isnan(value)]
 
-        card_counts = value_counts.values()
-        if 4 in card_counts:
-            return HandRank(HandClass.four_of_a_kind, value_counts)
+    def values(self):
+        return [value for value in self.percentages if not math.isnan(value)]
 
-        if 3 in card_counts and 2 in card_counts:
-            return HandRank(HandClass.full_house, value_counts)
+    def items(self):
+        return [(seat + 1, value) for seat, value in enumerate(self.percentages) if not math.isnan(value)]
 
-        if flush:
-            return HandRank(HandClass.flush, value_counts)
+    def get(self, player_index, default=None):
+        if not 1 <= player_index <= NUMBER_OF_SEATS:
+            return default
+        value = self.percentages[player_index - 1]
+        return default if math.isnan(value) else value
 
-        if straight:
-            return HandRank(HandClass.straight, value_counts)
+    def __getitem__(self, player_index):
+        value = self.get(player_index)
+        if value is None:
+            raise KeyError(player_index)
+        return value
 
-        if 3 in card_counts:
-            return HandRank(HandClass.three_of_a_kind, value_counts)
+    def __contains__(self, player_index):
+        return self.get(player_index) is not None
 
-        if list(card_counts).count(2) == 2:
-            return HandRank(HandClass.pair, value_counts)
+    def __iter__(self):
+        return iter(self.keys())
 
-        if 2 in card_counts:
-            return HandRank(HandClass.pair, value_counts)
+    def __len__(self):
+        return len(self.keys())
 
-        return HandRank(HandClass.high_card, value_counts)
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+
+class HandEquity(object):
+    """Calculates the win probabilities across the events of a single hand.
+
+    The strength of every live player's hand is calculated once for each
+    runout of the current board and kept. When a player folds, the wins are
+    simply recounted amongst the remaining players, and when a board card is
+    dealt, the kept runouts are filtered down to those which contain it. The
+    runouts are only enumerated (or sampled) afresh when neither of those
+    applies, for example, once the flop is dealt after sampling preflop.
+
+    Enumerated runouts which are equivalent under a permutation of the suits,
+    see suit_isomorphism_classes, are only evaluated once. So `strengths`
+    holds a row per class, and `classes` the class of each of the runouts.
+    For sampled runouts `classes` is None and there is a row per runout.
+
+    Exact results are also kept in the EQUITY_MEMO, keyed by the board and the
+    sorted pockets, so that a state which has been seen before, in this hand
+    or any other, need not be enumerated again. Estimates are not, since they
+    depend on the sample drawn, and so on the history of the hand."""
+    def __init__(self, hand):
+        self.hand = hand
+        self.settings = hand.equity_settings
+        self.players = []
+        self.board = []
+        self.runouts = []
+        self.classes = None
+        self.strengths = []
+        self.estimated = False
+        # Whether the runouts are deals including the hidden players' hands.
+        self.dealt_hidden = False
+        # Counts of the work done, which are reported when profiling.
+        self.boards_enumerated = 0
+        self.hands_evaluated = 0
+        self.boards_counted = 0
+
+    def calculate(self, players):
+        # Unless we are told what to make of them, don't bother attempting to
+        # calculate the probabilities for any players that ultimately do not
+        # show their hand, this is unfortunate, but just missing data.
+        if self.settings.hidden_hands is None or not any(p.pocket for p in players):
+            players = [p for p in players if p.pocket]
+        if not players:
+            return WinProbabilities({})
+        if len(players) == 1:
+            return WinProbabilities({ players[0].index: 100.0 })
+
+        board = [int(card) for card in self.hand.flop]
+        if not board and len(players) == 2 and all(p.pocket for p in players):
+            win_probabilities = self.look_up_preflop(players)
+            if win_probabilities is not None:
+                return win_probabilities
+        memo_key = self.memo_key(players, board)
+        if not self.can_reuse(players, board):
+            if memo_key is not None:
+                percentages = EQUITY_MEMO.get(memo_key)
+                if percentages is not None:
+                    return WinProbabilities(dict(zip(self.memo_order(players), percentages)))
+            try:
+                self.enumerate(players, board)
+            except HiddenHandsError:
+                message = ("The players who did not show cannot all hold hands in the range: {}, so they "
+                           "are left out of the win probabilities.".format(self.settings.hidden_hands))
+                if message not in self.hand.errors:
+                    self.hand.errors.append(message)
+                self.clear()
+                return self.calculate([p for p in players if p.pocket])
+        elif board != self.board:
+            new_cards = board[len(self.board):]
+            self.runouts, self.classes = select_runouts(self.runouts, self.classes, new_cards)
+            self.board = board
+        win_probabilities = self.count_wins(players)
+        if memo_key is not None and not self.estimated:
+            EQUITY_MEMO.put(memo_key, tuple(win_probabilities[index] for index in self.memo_order(players)))
+        return win_probabilities
+
+    def look_up_preflop(self, players):
+        # The table counts every board which the two pockets leave, so it is
+        # only exact when no other cards are known to be out of the deck, see
+        # dead_cards. Otherwise the state is sampled as usual.
+        if self.dead_cards(players):
+            return None
+        table = load_preflop_table(self.settings.preflop_table)
+        if table is None:
+            return None
+        hero, villain = players
+        percentages = table.look_up([int(card) for card in hero.pocket],
+                                    [int(card) for card in villain.pocket])
+        if percentages is None:
+            return None
+        return WinProbabilities(dict(zip([hero.index, villain.index], percentages)))
+
+    @staticmethod
+    def memo_order(players):
+        """The indexes of the players, in the order of their sorted pockets."""
+        return [player.index for player in sorted(players, key=lambda player: sorted(player.pocket))]
+
+    def memo_key(self, players, board):
+        """The key of the state in the EQUITY_MEMO, or None if it has no exact
+        result to keep or its cards are not all distinct. The dead cards are
+        part of the key, since they are kept out of the deck, see
+        dead_cards."""
+        if len(board) < 3 or not all(player.pocket for player in players):
+            return None
+        pockets = sorted(tuple(sorted(int(card) for card in player.pocket)) for player in players)
+        dead_cards = self.dead_cards(players)
+        cards = board + [card for pocket in pockets for card in pocket] + dead_cards
+        if len(set(cards)) != len(cards):
+            return None
+        return (tuple(board), tuple(pockets), tuple(dead_cards))
 
-    return max([hand_rank(h) for h in possible_hands])
+    def clear(self):
+        self.players = []
+        self.board = []
+        self.runouts = []
+        self.classes = None
+        self.strengths = []
+
+    def dead_cards(self, players):
+        """The known cards of the players taking part other than the given
+        ones, for example those who have folded. They can never be dealt to
+        the board, so they are always kept out of the deck, and so kept
+        runouts which are recounted after a fold give the same results as
+        runouts enumerated afresh."""
+        counted = set(player.index for player in players)
+        taking_part = getattr(self.hand, 'taking_part', None) or []
+        return sorted(int(card) for player in taking_part if player.index not in counted
+                      for card in player.pocket)
+
+    def can_reuse(self, players, board):
+        # Deals including the hidden hands cannot simply be filtered by a new
+        # board card, since they may have dealt it to a hidden player.
+        if not len(self.runouts) or (self.estimated or self.dealt_hidden) and board != self.board:
+            return False
+        if board[:len(self.board)] != self.board:
+            return False
+        return all(player in self.players for player in players)
+
+    def enumerate(self, players, board):
+        deck = list(range(52))
+        for card in self.hand.flop:
+            try:
+                deck.remove(card)
+            except ValueError:
+                self.hand.errors.append("The card: {}, appears twice on the flop.".format(card))
+        for player in players:
+            for card in player.pocket:
+                try:
+                    deck.remove(card)
+                except ValueError:
+                    self.hand.errors.append("The card: {} appears twice in player pockets and/or the flop".format(card))
+        for card in self.dead_cards(players):
+            if card in deck:
+                deck.remove(card)
+
+        self.players = players
+        self.board = board
+        self.dealt_hidden = not all(player.pocket for player in players)
+        if self.dealt_hidden:
+            self.deal_hidden_hands(players, deck)
+            return
+        pockets = [[int(card) for card in player.pocket] for player in players]
+        # Before the flop there are far too many runouts to enumerate, so we
+        # estimate from a sample instead.
+        self.estimated = len(board) < 3
+        if self.estimated:
+            self.sample_runouts(pockets, deck)
+            return
+        runouts = list(itertools.combinations(deck, 5 - len(board)))
+        if use_numpy():
+            runouts = numpy.array(runouts, dtype=numpy.int64).reshape(len(runouts), -1)
+        classes, representatives = suit_isomorphism_classes(runouts, pockets, board)
+        self.runouts = runouts
+        self.classes = classes
+        self.strengths = evaluate_runouts(pockets, board, representatives)
+        self.boards_enumerated += len(runouts)
+        self.hands_evaluated += len(representatives) * len(pockets)
+
+    def deal_hidden_hands(self, players, deck):
+        """For when some of the players' hands are hidden. Each deal is a
+        runout followed by a pocket for each of the hidden players, in the
+        order they appear in `players`, drawn from the hands in the
+        `hidden_hands` range, and every deal which does not clash with the
+        known cards is equally likely. If there are at most `max_samples` of
+        them, which is the case on the river, they are all enumerated,
+        otherwise they are sampled as for sample_runouts."""
+        settings = self.settings
+        hand_classes = parse_hand_range(settings.hidden_hands)
+        candidates = [pocket for pocket in itertools.combinations(deck, 2)
+                      if starting_hand_class(pocket) in hand_classes]
+        pockets = [[int(card) for card in player.pocket] or None for player in players]
+        number_hidden = pockets.count(None)
+        if not candidates:
+            raise HiddenHandsError()
+        draw_size = 5 - len(self.board)
+        most_deals = len(candidates) ** number_hidden * math.comb(len(deck) - 2 * number_hidden, draw_size)
+        self.estimated = most_deals > settings.max_samples
+        if self.estimated:
+            rng = random.Random("{}:{}:{}".format(settings.seed, pockets, self.board))
+
+            def draw():
+                hidden_cards = draw_hidden_cards(rng, candidates, number_hidden)
+                remaining = [card for card in deck if card not in hidden_cards]
+                return tuple(rng.sample(remaining, draw_size)) + hidden_cards
+            self.sample(pockets, draw, evaluate_deals)
+            return
+        deals = []
+        for hidden_pockets in itertools.product(candidates, repeat=number_hidden):
+            hidden_cards = tuple(card for pocket in hidden_pockets for card in pocket)
+            if len(set(hidden_cards)) != len(hidden_cards):
+                continue
+            remaining = [card for card in deck if card not in hidden_cards]
+            deals.extend(runout + hidden_cards for runout in itertools.combinations(remaining, draw_size))
+        if not deals:
+            raise HiddenHandsError()
+        if use_numpy():
+            deals = numpy.array(deals, dtype=numpy.int64)
+        self.runouts = deals
+        self.classes = None
+        self.strengths = evaluate_deals(pockets, self.board, deals)
+        self.boards_enumerated += len(deals)
+        self.hands_evaluated += len(deals) * len(pockets)
+
+    def sample_runouts(self, pockets, deck):
+        rng = random.Random("{}:{}:{}".format(self.settings.seed, pockets, self.board))
+        draw_size = 5 - len(self.board)
+
+        def draw():
+            return tuple(rng.sample(deck, draw_size))
+        self.sample(pockets, draw, evaluate_runouts)
+
+    def sample(self, pockets, draw, evaluate):
+        """Draws runouts, or deals, one at a time with `draw` and evaluates
+        them in batches with `evaluate`, as evaluate_runouts."""
+        settings = self.settings
+        # So that loading the tables is not counted against the time budget.
+        load_tables()
+        deadline = time.perf_counter() + settings.time_budget
+        batches = []
+        win_count = [0] * len(pockets)
+        all_columns = list(range(len(pockets)))
+        number_draws = 0
+        while number_draws < settings.max_samples:
+            batch_size = min(settings.batch_size, settings.max_samples - number_draws)
+            runouts = [draw() for _ in range(batch_size)]
+            if use_numpy():
+                runouts = numpy.array(runouts, dtype=numpy.int64)
+            strengths = evaluate(pockets, self.board, runouts)
+            batch_wins = count_runout_wins(strengths, all_columns)
+            win_count = [wins + new_wins for wins, new_wins in zip(win_count, batch_wins)]
+            batches.append((runouts, strengths))
+            number_draws += batch_size
+            if number_draws < settings.min_samples:
+                continue
+            standard_errors = [standard_error(wins, number_draws) for wins in win_count]
+            if max(standard_errors) <= settings.target_standard_error:
+                break
+            if time.perf_counter() >= deadline:
+                break
+        self.runouts, self.strengths = join_runouts(batches)
+        self.classes = None
+        self.boards_enumerated += number_draws
+        self.hands_evaluated += number_draws * len(pockets)
+
+    def count_wins(self, players):
+        columns = [self.players.index(player) for player in players]
+        weights = None if self.classes is None else class_weights(self.classes, len(self.strengths))
+        win_count = count_runout_wins(self.strengths, columns, weights)
+        self.boards_counted += len(self.strengths)
+        number_draws = len(self.runouts)
+        percentages = { player.index: 100 * wins / number_draws for player, wins in zip(players, win_count)}
+        if not self.estimated:
+            return WinProbabilities(percentages)
+        margins = { player.index: 1.96 * standard_error(wins, number_draws)
+                    for player, wins in zip(players, win_count)}
+        return WinProbabilities(percentages, margins=margins, samples=number_draws)
+
+
+def standard_error(wins, number_draws):
+    """The standard error, in percentage points, of a win percentage estimated
+    from a sample of runouts."""
+    p = wins / number_draws
+    return 100 * math.sqrt(p * (1 - p) / number_draws)
+
+
+# The runouts of a HandEquity, and the strengths of each player's hand on each
+# of them, are held either in numpy arrays, one row per runout, or when numpy
+# is not installed, lists of tuples. These functions work with either.
+USE_NUMPY = True
+
+def use_numpy():
+    global numpy, USE_NUMPY
+    if USE_NUMPY and numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            USE_NUMPY = False
+    return USE_NUMPY
+
+def evaluate_runouts(pockets, board, runouts):
+    if not use_numpy():
+        return [tuple(hand_strength(pocket + board + list(runout)) for pocket in pockets)
+                for runout in runouts]
+    columns = []
+    for pocket in pockets:
+        known = numpy.array(pocket + board, dtype=numpy.int64)
+        cards = numpy.hstack([numpy.broadcast_to(known, (len(runouts), len(known))), runouts])
+        columns.append(hand_strength_array(cards))
+    return numpy.stack(columns, axis=1)
+
+def evaluate_deals(pockets, board, deals):
+    """As evaluate_runouts, but those of the pockets which are None are those
+    of the hidden players, whose cards follow the runout in each deal, see
+    HandEquity.deal_hidden_hands."""
+    draw_size = 5 - len(board)
+    hidden_columns = []
+    column = draw_size
+    for pocket in pockets:
+        hidden_columns.append(column if pocket is None else None)
+        column += 2 if pocket is None else 0
+    if not use_numpy():
+        return [tuple(hand_strength((list(deal[column:column + 2]) if pocket is None else pocket)
+                                    + board + list(deal[:draw_size]))
+                      for pocket, column in zip(pockets, hidden_columns))
+                for deal in deals]
+    runouts = deals[:, :draw_size]
+    columns = []
+    for pocket, column in zip(pockets, hidden_columns):
+        if pocket is None:
+            known = numpy.broadcast_to(numpy.array(board, dtype=numpy.int64), (len(deals), len(board)))
+            cards = numpy.hstack([deals[:, column:column + 2], known, runouts])
+        else:
+            known = numpy.array(pocket + board, dtype=numpy.int64)
+            cards = numpy.hstack([numpy.broadcast_to(known, (len(deals), len(known))), runouts])
+        columns.append(hand_strength_array(cards))
+    return numpy.stack(columns, axis=1)
+
+class HiddenHandsError(ValueError):
+    """The hidden players cannot all be dealt hands in the range."""
+
+def draw_hidden_cards(rng, candidates, number_hidden, attempts=10000):
+    """Draws a pocket for each hidden player from the candidates, redrawing
+    them all whenever two share a card, so that each combination which does
+    not is equally likely. Returns the cards as a tuple."""
+    for _ in range(attempts):
+        hidden_cards = tuple(card for _p in range(number_hidden) for card in rng.choice(candidates))
+        if len(set(hidden_cards)) == len(hidden_cards):
+            return hidden_cards
+    raise HiddenHandsError()
+
+def select_runouts(runouts, classes, cards):
+    """Returns only those runouts, and their classes, which contain all of
+    the given cards."""
+    if not use_numpy():
+        kept = [(runout, runout_class) for runout, runout_class in zip(runouts, classes)
+                if all(card in runout for card in cards)]
+        return [runout for runout, _c in kept], [runout_class for _r, runout_class in kept]
+    selected = numpy.ones(len(runouts), dtype=bool)
+    for card in cards:
+        selected &= (runouts == card).any(axis=1)
+    return runouts[selected], classes[selected]
+
+def class_weights(classes, number_of_classes):
+    """The number of runouts in each class."""
+    if not use_numpy():
+        weights = [0] * number_of_classes
+        for runout_class in classes:
+            weights[runout_class] += 1
+        return weights
+    return numpy.bincount(classes, minlength=number_of_classes)
+
+def join_runouts(batches):
+    if not use_numpy():
+        runouts = [runout for batch_runouts, _s in batches for runout in batch_runouts]
+        strengths = [row for _r, batch_strengths in batches for row in batch_strengths]
+        return runouts, strengths
+    return (numpy.concatenate([runouts for runouts, _s in batches]),
+            numpy.concatenate([strengths for _r, strengths in batches]))
+
+def count_runout_wins(strengths, columns, weights=None):
+    """Counts, for each of the given columns (players), the number of runouts
+    which that player wins or ties amongst the players in those columns. If
+    given, `weights` is the number of runouts each row of strengths stands
+    for, otherwise it is one each."""
+    if not use_numpy():
+        win_count = [0] * len(columns)
+        if weights is None:
+            weights = itertools.repeat(1)
+        for runout_strengths, weight in zip(strengths, weights):
+            live_strengths = [runout_strengths[column] for column in columns]
+            best = max(live_strengths)
+            for index, strength in enumerate(live_strengths):
+                if strength == best:
+                    win_count[index] += weight
+        return win_count
+    live_strengths = strengths[:, columns]
+    best = live_strengths.max(axis=1, keepdims=True)
+    winners = live_strengths == best
+    if weights is not None:
+        winners = winners * weights[:, None]
+    return [int(wins) for wins in winners.sum(axis=0)]
+
+def suit_isomorphism_classes(runouts, pockets, board):
+    """Divides the runouts into classes within which every player's hand has
+    the same strength on each runout, returning the class of each runout and a
+    representative runout of each class.
+
+    Two runouts are in the same class if some permutation of the suits maps
+    one to the other while leaving the board and every pocket unchanged, since
+    hand strengths do not depend on which suit is which. In addition, a suit in
+    which no player can make a flush, even if every card drawn is of that suit,
+    is 'dead', and the suit of a drawn card in a dead suit only matters in that
+    it is dead, so all the dead suits are treated as a single suit.
+
+    With numpy, the runouts are an array and so are the classes and the
+    representatives, which are found without a loop over the runouts, since
+    otherwise classifying them takes longer than evaluating them all."""
+    draw_size = len(runouts[0]) if len(runouts) else 0
+    known = [pocket + board for pocket in pockets]
+    dead_suit = 4
+
+    def suit_count(cards, suit):
+        return sum(1 for card in cards if card & 3 == suit)
+
+    def signature(suit):
+        return (tuple(sorted(card >> 2 for card in board if card & 3 == suit)),
+                tuple(tuple(sorted(card >> 2 for card in pocket if card & 3 == suit)) for pocket in pockets))
+
+    # Live suits with the same signature may be swapped for one another.
+    interchangeable = defaultdict(list)
+    for suit in range(4):
+        if any(suit_count(cards, suit) + draw_size >= 5 for cards in known):
+            interchangeable[signature(suit)].append(suit)
+    groups = list(interchangeable.values())
+    suit_maps = []
+    for permutations in itertools.product(*[itertools.permutations(group) for group in groups]):
+        suit_map = [dead_suit] * 4
+        for group, permutation in zip(groups, permutations):
+            for suit, mapped_suit in zip(group, permutation):
+                suit_map[suit] = mapped_suit
+        suit_maps.append(suit_map)
+
+    if use_numpy():
+        # Each runout's key is its sorted cards, as mapped, as the digits of a
+        # number, and the least over the suit maps identifies its class.
+        digits = 65 ** numpy.arange(draw_size, dtype=numpy.int64)
+        values = (runouts >> 2) * 5
+        suits = runouts & 3
+        keys = None
+        for suit_map in suit_maps:
+            mapped_keys = numpy.sort(values + numpy.array(suit_map)[suits], axis=1) @ digits
+            keys = mapped_keys if keys is None else numpy.minimum(keys, mapped_keys)
+        _keys, first, classes = numpy.unique(keys, return_index=True, return_inverse=True)
+        return classes.reshape(-1), runouts[first]
+
+    class_indexes = {}
+    classes = []
+    representatives = []
+    for runout in runouts:
+        key = min(tuple(sorted((card >> 2) * 5 + suit_map[card & 3] for card in runout))
+                  for suit_map in suit_maps)
+        runout_class = class_indexes.get(key)
+        if runout_class is None:
+            runout_class = class_indexes[key] = len(representatives)
+            representatives.append(runout)
+        classes.append(runout_class)
+    return classes, representatives
+
+
+# The exact heads up win probabilities before the flop are kept in a binary
+# file, generated by preflop_table.py, which is memory mapped. A header is
+# followed by an entry for each of the 169 classes of starting hand (the
+# hero's) and each of the 1326 pockets (the villain's), in which the suits of
+# both pockets have been mapped so that the hero's is the representative of
+# its class, see canonical_suit_map. Each entry is the number of boards which
+# the hero, and the villain, win (or tie), or PREFLOP_TABLE_MISSING if the
+# entry has not been generated or the pockets share a card.
+PREFLOP_TABLE_MAGIC = b'PHPF'
+PREFLOP_TABLE_VERSION = 1
+PREFLOP_TABLE_HEADER = struct.Struct('<4sIIII')
+PREFLOP_TABLE_ENTRY = struct.Struct('<II')
+PREFLOP_TABLE_MISSING = 0xFFFFFFFF
+NUMBER_OF_POCKETS = 52 * 51 // 2
+NUMBER_OF_PREFLOP_BOARDS = math.comb(48, 5)
+
+def starting_hand_classes():
+    """The classes of starting hand, as (high value, low value, suited)."""
+    classes = []
+    for high in range(14, 1, -1):
+        classes.append((high, high, False))
+        for low in range(high - 1, 1, -1):
+            classes.extend([(high, low, True), (high, low, False)])
+    return classes
+
+STARTING_HAND_CLASSES = starting_hand_classes()
+STARTING_HAND_CLASS_INDEXES = {hand_class: index for index, hand_class in enumerate(STARTING_HAND_CLASSES)}
+
+def starting_hand_class(pocket):
+    high, low = sorted(pocket, reverse=True)
+    return STARTING_HAND_CLASS_INDEXES[(high >> 2) + 2, (low >> 2) + 2, high & 3 == low & 3]
+
+RANGE_VALUES = dict({'a': 14, 'k': 13, 'q': 12, 'j': 11, 't': 10}, **{str(value): value for value in range(2, 10)})
+
+@functools.lru_cache(maxsize=None)
+def parse_hand_range(text):
+    """The indexes of the starting hand classes, see starting_hand_class, in
+    a range written in the usual shorthand, for example "77+, A9s+, KQ, AJo".
+    A pair followed by a + includes the higher pairs, and any other hand the
+    same high card with the higher kickers. "random" is every hand. Raises a
+    ValueError if the range cannot be parsed."""
+    if text.strip().lower() == 'random':
+        return frozenset(range(len(STARTING_HAND_CLASSES)))
+    hand_classes = set()
+    for token in text.replace(',', ' ').split():
+        name = token.lower()
+        plus = name.endswith('+')
+        name = name.rstrip('+')
+        if not (2 <= len(name) <= 3 and name[0] in RANGE_VALUES and name[1] in RANGE_VALUES
+                and name[2:] in ('', 's', 'o')):
+            raise ValueError("Cannot understand the hand: {}, in the range: {}".format(token, text))
+        high, low = sorted((RANGE_VALUES[name[0]], RANGE_VALUES[name[1]]), reverse=True)
+        if high == low:
+            if name[2:]:
+                raise ValueError("A pair cannot be suited or offsuit: {}, in the range: {}".format(token, text))
+            hand_classes.update((value, value, False) for value in range(high, 15 if plus else high + 1))
+            continue
+        suited = [name[2:] == 's'] if name[2:] else [True, False]
+        hand_classes.update((high, kicker, is_suited)
+                            for kicker in range(low, high if plus else low + 1) for is_suited in suited)
+    if not hand_classes:
+        raise ValueError("The range is empty: {}".format(text))
+    return frozenset(STARTING_HAND_CLASS_INDEXES[hand_class] for hand_class in hand_classes)
+
+def pocket_index(pocket):
+    """An index, from 0 to NUMBER_OF_POCKETS - 1, of two encoded cards."""
+    low, high = sorted(pocket)
+    return high * (high - 1) // 2 + low
+
+def canonical_suit_map(pocket):
+    """The permutation of the suits, as a list, which maps the suit of the
+    higher card of the pocket to clubs, that of the lower card (if different)
+    to hearts, and the remaining suits to the remaining suits in order."""
+    high, low = sorted(pocket, reverse=True)
+    order = [high & 3]
+    if low & 3 != high & 3:
+        order.append(low & 3)
+    order.extend(suit for suit in range(4) if suit not in order)
+    suit_map = [0] * 4
+    for mapped_suit, suit in enumerate(order):
+        suit_map[suit] = mapped_suit
+    return suit_map
+
+def map_suits(cards, suit_map):
+    return [card & ~3 | suit_map[card & 3] for card in cards]
+
+def preflop_table_position(hero, villain):
+    """The index of the entry for the given encoded pockets."""
+    villain = map_suits(villain, canonical_suit_map(hero))
+    return starting_hand_class(hero) * NUMBER_OF_POCKETS + pocket_index(villain)
+
+class PreflopTable(object):
+    def __init__(self, filename, writable=False):
+        with open(filename, 'r+b' if writable else 'rb') as table_file:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self.data = mmap.mmap(table_file.fileno(), 0, access=access)
+        header = PREFLOP_TABLE_HEADER.unpack_from(self.data)
+        expected = (PREFLOP_TABLE_MAGIC, PREFLOP_TABLE_VERSION, len(STARTING_HAND_CLASSES),
+                    NUMBER_OF_POCKETS, NUMBER_OF_PREFLOP_BOARDS)
+        if header != expected:
+            raise ValueError("{} is not a preflop equity table of this version.".format(filename))
+
+    @classmethod
+    def create(cls, filename):
+        """Writes a table in which every entry is missing."""
+        with open(filename, 'wb') as table_file:
+            table_file.write(PREFLOP_TABLE_HEADER.pack(
+                PREFLOP_TABLE_MAGIC, PREFLOP_TABLE_VERSION, len(STARTING_HAND_CLASSES),
+                NUMBER_OF_POCKETS, NUMBER_OF_PREFLOP_BOARDS))
+            missing = PREFLOP_TABLE_ENTRY.pack(PREFLOP_TABLE_MISSING, PREFLOP_TABLE_MISSING)
+            table_file.write(missing * (len(STARTING_HAND_CLASSES) * NUMBER_OF_POCKETS))
+        return cls(filename, writable=True)
+
+    @staticmethod
+    def offset(position):
+        return PREFLOP_TABLE_HEADER.size + position * PREFLOP_TABLE_ENTRY.size
+
+    def win_counts(self, position):
+        """The numbers of boards won by the hero and the villain, or None."""
+        counts = PREFLOP_TABLE_ENTRY.unpack_from(self.data, self.offset(position))
+        if counts[0] == PREFLOP_TABLE_MISSING:
+            return None
+        return counts
+
+    def set_win_counts(self, position, hero_wins, villain_wins):
+        PREFLOP_TABLE_ENTRY.pack_into(self.data, self.offset(position), hero_wins, villain_wins)
+
+    def look_up(self, hero, villain):
+        """Returns the percentages of the boards which the hero and the villain
+        win (or tie), given their encoded pockets, or None if the table does not
+        have them."""
+        if len(set(hero + villain)) != 4:
+            return None
+        counts = self.win_counts(preflop_table_position(hero, villain))
+        if counts is None:
+            return None
+        return [100 * wins / NUMBER_OF_PREFLOP_BOARDS for wins in counts]
 
+    def close(self):
+        self.data.close()
 
+PREFLOP_TABLES = {}
+
+def load_preflop_table(filename):
+    """Returns the PreflopTable in the given file, relative to the program's
+    files (see resource_base_path) unless absolute, which is only opened once
+    per process, or None if there is no such file."""
+    if not filename:
+        return None
+    if filename not in PREFLOP_TABLES:
+        path = os.path.join(resource_base_path(), filename)
+        PREFLOP_TABLES[filename] = PreflopTable(path) if os.path.exists(path) else None
+    return PREFLOP_TABLES[filename]
+
+def preflop_table_signature(filename):
+    """Identifies the contents of the preflop table file, if any, since the
+    calculated hands depend on it, see HandCache."""
+    path = os.path.join(resource_base_path(), filename) if filename else None
+    if not path or not os.path.exists(path):
+        return None
+    status = os.stat(path)
+    return [status.st_size, status.st_mtime]
 
 
 class PokerHand(object):
-    def __init__(self):
+    __slots__ = ('equity_settings', 'equity', 'players', '_events', 'event_fields', 'flop', 'errors',
+                 'error_report', 'number', 'starting_time', 'title', 'ante',
+                 'small_blind', 'big_blind', 'dealer', 'small_blind_player',
+                 'big_blind_player', 'taking_part', 'timings')
+
+    def __init__(self, equity_settings=None):
+        self.equity_settings = equity_settings or DEFAULT_EQUITY_SETTINGS
+        self.equity = HandEquity(self)
         self.players = []
-        self.events = []
+        self._events = None
+        # The csv fields of the events, which are only decoded when the events
+        # are first needed, see parse_hand.
+        self.event_fields = None
         self.flop = []
         self.errors = []
+        self.error_report = None
         self.number = 'No hand number parsed'
+        # The header fields, which are left as None if the header cannot be
+        # parsed, so that the snapshot and index can still record the hand.
+        self.starting_time = None
+        self.title = None
+        self.ante = None
+        self.small_blind = None
+        self.big_blind = None
+        self.dealer = None
+        self.small_blind_player = None
+        self.big_blind_player = None
+        # Only when profiling, see Profiler.
+        self.timings = None
+
+    @property
+    def events(self):
+        if self._events is None:
+            # If decoding fails, the events decoded so far are kept, and the
+            # error is not raised again.
+            fields, self.event_fields = self.event_fields or [], None
+            self._events = EventList()
+            decode_events(fields, self._events)
+        return self._events
 
     def get_player(self, player_index):
         return next((p for p in self.players if p.index == player_index), None)
@@ -232,42 +1233,26 @@ class PokerHand(object):
         return winners
 
     def calculate_probabilities(self, players):
-        # Don't bother attempting to calculate the probabilities for any players
-        # that ultimately do not show their hand, this is unfortunate, but just
-        # missing data and nothing we can do about it.
-        players = [p for p in players if p.pocket]
-        if len(self.flop) < 3:
-            return None
-        if not players:
-            return {}
-        if len(players) == 1:
-            return { players[0].index: 100.0 }
-
-        deck = new_deck()
-        for card in self.flop:
-            try:
-                deck.remove(card)
-            except ValueError:
-                self.errors.append("The card: {}, appears twice on the flop.".format(card))
-        for player in players:
-            for card in player.pocket:
-                try:
-                    deck.remove(card)
-                except ValueError:
-                    self.errors.append("The card: {} appears twice in player pockets and/or the flop".format(card))
-
-        possible_draws = itertools.combinations(deck, 5 - len(self.flop))
-        win_count = defaultdict(int)
-        number_draws = 0
-        for draw in possible_draws:
-            number_draws += 1
-            board = self.flop + list(draw)
-            for winner in self.calculate_winners(players, board):
-                win_count[winner] += 1
-
-        def get_percentage(n):
-            return 100 * n / number_draws
-        return { player.index: get_percentage(win_count[player]) for player in players}
+        return self.equity.calculate(players)
+
+    def profile_probabilities(self, event, players):
+        equity = self.equity
+        boards_enumerated = equity.boards_enumerated
+        hands_evaluated = equity.hands_evaluated
+        boards_counted = equity.boards_counted
+        start = time.perf_counter()
+        win_probabilities = self.calculate_probabilities(players)
+        seconds = time.perf_counter() - start
+        self.timings['equity'] += seconds
+        self.timings['events'].append({
+            'position': event.position,
+            'action': event.action,
+            'seconds': seconds,
+            'boards_enumerated': equity.boards_enumerated - boards_enumerated,
+            'hands_evaluated': equity.hands_evaluated - hands_evaluated,
+            'boards_counted': equity.boards_counted - boards_counted,
+            })
+        return win_probabilities
 
     def get_remaining_players(self):
         return [p for p in self.taking_part if not p.folded]
@@ -299,7 +1284,7 @@ class PokerHand(object):
         # Also check that any player not taking part did not receive cards
         for p in self.players:
             if p not in self.taking_part:
-                if p.cards:
+                if p.pocket:
                     self.errors.append("""Player {}({}) does not seem to be taking part in the hand but
                     nevertheless received cards.""".format(p.name, p.index))
 
@@ -309,7 +1294,8 @@ class PokerHand(object):
             player_description = "{} ({})".format(player.name, player.index) if player else None
             if event.action == 'BOARD':
                 event.bold = True
-                self.flop.append(parse_card(event.card))
+                assert event.card is not None, "A BOARD event without a card."
+                self.flop.append(event.card)
                 num_table_cards = len(self.flop)
                 if num_table_cards < 3:
                     event.display = False
@@ -357,14 +1343,21 @@ class PokerHand(object):
             event.pot = pot
             # After we have taken the action of the event we re-calculate the
             # win probabilities, but for bet/calls (and all_ins) we know that
-            # the probabilities will not have changed.
-            if event.action in ['BET', 'CALL', 'ALL_IN']:
+            # the probabilities will not have changed. Nor are they worth
+            # calculating for the first two cards of the flop, which are not
+            # displayed.
+            if event.action in ['BET', 'CALL', 'ALL_IN'] or not event.display:
                 event.win_probabilities = most_recent_win_probabilities
             else:
                 remaining_players = self.get_remaining_players()
-                event.win_probabilities = self.calculate_probabilities(remaining_players)
+                if self.timings is None:
+                    event.win_probabilities = self.calculate_probabilities(remaining_players)
+                else:
+                    event.win_probabilities = self.profile_probabilities(event, remaining_players)
                 most_recent_win_probabilities = event.win_probabilities
         # End of event stream.
+        # The kept runouts are only useful while processing the event stream.
+        self.equity.clear()
 
         # It should not really be possible that this has not already been called
         # since we should have had at least one FOLD or BOARD event, but since we're
@@ -392,6 +1385,9 @@ class PokerHand(object):
 
 class Player(object):
     """Note that this only represents a player during one hand."""
+    __slots__ = ('index', 'name', 'straddle', 'pocket', 'starting_stack', 'ending_stack',
+                 'hand_winner', 'folded', 'best_hand_rank')
+
     def __init__(self, index):
         self.index = index
         self.hand_winner = False
@@ -402,6 +1398,10 @@ class Player(object):
         # The ending stack will be updated in the Hand.calculate_hand method.
         self.ending_stack = stack
 
+    @property
+    def cards(self):
+        return " ".join(str(card) for card in self.pocket)
+
     @property
     def is_empty_seat(self):
         return self.name.startswith("SEAT")
@@ -415,16 +1415,125 @@ class Player(object):
         return self.starting_stack - self.ending_stack
 
 
+ACTIONS = ['BOARD', 'BET', 'CALL', 'FOLD', 'ALL_IN']
+
+class EventList(object):
+    """The events of a hand. Rather than an object per event, each attribute
+    of the events is held in its own array, or list, and Event objects are
+    only created as views onto those when the events are accessed. In the
+    integer arrays -1 stands for None."""
+    __slots__ = ('starting_times', 'actions', 'players', 'cards', 'amounts', 'pots',
+                 'displays', 'bolds', 'descriptions', 'win_probabilities')
+
+    def __init__(self):
+        self.starting_times = []
+        self.actions = array.array('b')
+        self.players = array.array('b')
+        self.cards = array.array('b')
+        self.amounts = array.array('q')
+        self.pots = array.array('q')
+        self.displays = array.array('b')
+        self.bolds = array.array('b')
+        self.descriptions = []
+        self.win_probabilities = []
+
+    def append(self, starting_time, action, player=None, card=None, amount=0):
+        self.starting_times.append(starting_time)
+        self.actions.append(ACTIONS.index(action))
+        self.players.append(-1 if player is None else player)
+        self.cards.append(-1 if card is None else card)
+        self.amounts.append(-1 if amount is None else amount)
+        self.pots.append(0)
+        self.displays.append(True)
+        self.bolds.append(False)
+        self.descriptions.append(None)
+        self.win_probabilities.append(None)
+
+    def __len__(self):
+        return len(self.starting_times)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return Event(self, position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield Event(self, position)
+
+def optional(value):
+    return None if value == -1 else value
+
 class Event(object):
-    def __init__(self, starting_time):
-        self.starting_time = starting_time
-        self.action = ""
-        self.player = ""
-        self.card = ""
-        self.amount = 0
-        self.display = True
-        self.bold = False
-        self.win_probabilities = None
+    """A view of one of the events in an EventList."""
+    __slots__ = ('events', 'position')
+
+    def __init__(self, events, position):
+        self.events = events
+        self.position = position
+
+    @property
+    def starting_time(self):
+        return self.events.starting_times[self.position]
+
+    @property
+    def action(self):
+        return ACTIONS[self.events.actions[self.position]]
+
+    @property
+    def player(self):
+        return optional(self.events.players[self.position])
+
+    @property
+    def card(self):
+        code = self.events.cards[self.position]
+        return None if code == -1 else CARDS[code]
+
+    @property
+    def amount(self):
+        return optional(self.events.amounts[self.position])
+
+    @property
+    def pot(self):
+        return self.events.pots[self.position]
+
+    @pot.setter
+    def pot(self, pot):
+        self.events.pots[self.position] = pot
+
+    @property
+    def display(self):
+        return bool(self.events.displays[self.position])
+
+    @display.setter
+    def display(self, display):
+        self.events.displays[self.position] = display
+
+    @property
+    def bold(self):
+        return bool(self.events.bolds[self.position])
+
+    @bold.setter
+    def bold(self, bold):
+        self.events.bolds[self.position] = bold
+
+    @property
+    def description(self):
+        return self.events.descriptions[self.position]
+
+    @description.setter
+    def description(self, description):
+        self.events.descriptions[self.position] = description
+
+    @property
+    def win_probabilities(self):
+        return self.events.win_probabilities[self.position]
+
+    @win_probabilities.setter
+    def win_probabilities(self, win_probabilities):
+        self.events.win_probabilities[self.position] = win_probabilities
 
     def max_probability(self):
         return max(self.win_probabilities.values())
@@ -434,10 +1543,51 @@ def parse_int(s):
         return None
     return int(s)
 
-def parse_hand(fields):
+PLAYERS_STARTING_INDEX = 8
+EVENTS_STARTING_INDEX = PLAYERS_STARTING_INDEX + 4 * NUMBER_OF_SEATS
+
+def decode_events(fields, events=None):
+    """Returns an EventList of the events in the given csv fields, those of
+    a row from EVENTS_STARTING_INDEX on, appending them to `events` if given."""
+    if events is None:
+        events = EventList()
+    for event_start in range(0, len(fields), 5):
+        starting_time = fields[event_start]
+        if not starting_time:
+            continue
+        action = fields[event_start + 1]
+
+        assert action in ACTIONS
+        # The very last event is generally cut off at the point it has no more
+        # information, and the last event is often a fold hence we just assume
+        # if there is an index error then the rest of the fields are empty.
+        player = card = None
+        amount = 0
+        try:
+            player = parse_int(fields[event_start + 2])
+            card_text = fields[event_start + 3]
+            card = parse_card(card_text) if card_text else None
+            amount = parse_int(fields[event_start + 4])
+        except IndexError:
+            pass
+        events.append(starting_time, action, player, card, amount)
+    return events
+
+def parse_hand(fields, equity_settings=None, calculate=True, profile=False, header_only=False):
+    """Parses a csv row into a PokerHand, and unless `calculate` is False,
+    calculates the hand, see PokerHand.calculate_hand. If `profile` is True the
+    time taken by each stage is recorded in `hand.timings`.
+
+    The events are only decoded when first needed, which is straight away if
+    the hand is calculated. If `header_only` is True they are not kept at
+    all, nor is the hand calculated, which is enough to list or filter hands
+    by their title, time, blinds or players."""
     if not fields or fields[0].startswith("//"):
         return None
-    hand = PokerHand()
+    hand = PokerHand(equity_settings)
+    if profile:
+        start = time.perf_counter()
+        hand.timings = {'parse': 0.0, 'calculate': 0.0, 'equity': 0.0, 'events': []}
     try:
         hand.starting_time = fields[0]
         hand.title = fields[1]
@@ -451,96 +1601,1443 @@ def parse_hand(fields):
         hand.dealer = parse_int(fields[5])
         hand.small_blind_player = parse_int(fields[6])
         hand.big_blind_player = parse_int(fields[7])
-        players_starting_index = 8
-        number_of_players = 10
-        for player_index in range(1,number_of_players + 1):
-            start_index = players_starting_index + ((player_index - 1) * 4)
+        for player_index in range(1, NUMBER_OF_SEATS + 1):
+            start_index = PLAYERS_STARTING_INDEX + ((player_index - 1) * 4)
+            name = fields[start_index]
+            if name.startswith("SEAT"):
+                continue
             player = Player(player_index)
-            player.name = fields[start_index]
+            player.name = name
             player.straddle = parse_int(fields[start_index + 1])
-            player.cards = fields[start_index + 2]
-            player.pocket = parse_pocket(player.cards)
+            player.pocket = parse_pocket(fields[start_index + 2])
             player.init_stack(int(fields[start_index + 3]))
+            hand.players.append(player)
 
-            if not player.name.startswith("SEAT"):
-                hand.players.append(player)
-
-        events_starting_index = players_starting_index + 4 * number_of_players
-        for event_start in range(events_starting_index, len(fields), 5):
-            starting_time = fields[event_start]
-            if not starting_time:
-                continue
-            event = Event(starting_time)
-            event.action = fields[event_start + 1]
-
-            assert event.action in ['BOARD', 'BET', 'CALL', 'FOLD', 'ALL_IN']
-            # The very last event is generally cut off at the point it has no more
-            # information, and the last event is often a fold hence we just assume
-            # if there is an index error then the rest of the fields are empty.
-            try:
-                event.player = parse_int(fields[event_start + 2])
-                event.card = fields[event_start + 3]
-                event.amount = parse_int(fields[event_start + 4])
-            except IndexError:
-                pass
-            hand.events.append(event)
-        if not hand.events:
+        if header_only:
+            return hand
+        hand.event_fields = fields[EVENTS_STARTING_INDEX:]
+        if not any(hand.event_fields[::5]):
             hand.errors.append("No events associated with this hand.")
-        hand.calculate_hand()
+        if profile:
+            calculate_start = time.perf_counter()
+            hand.timings['parse'] = calculate_start - start
+            memo_before = memo_statistics()
+        if calculate:
+            hand.calculate_hand()
+        if profile:
+            hand.timings['calculate'] = time.perf_counter() - calculate_start
+            hand.timings['memo'] = {
+                tier: {count: statistics[count] - memo_before[tier][count] for count in ('hits', 'misses')}
+                for tier, statistics in memo_statistics().items()}
     except Exception as error:
-        print("---------------------")
-        print("Error in hand {}: {}".format(hand.number, error))
+        # This is not printed here, because the hand may have been parsed in
+        # a worker process, see read_poker_datafile.
+        hand.error_report = "\n".join([
+            "---------------------",
+            "Error in hand {}: {}".format(hand.number, error),
+            traceback.format_exc().rstrip(),
+            "---------------------",
+            ])
         hand.errors.append("Some irregularity in this hand's data was detected.")
-        traceback.print_exc()
-        print("---------------------")
+        hand.equity.clear()
     return hand
 
-def read_poker_datafile(filename):
+def read_rows(lines):
+    """Reads the lines of a csv file, as written by the exporter, into rows,
+    without the empty columns the exporter pads every row with. These are
+    stripped from each line before the csv module sees it, which is much
+    cheaper than splitting them into fields and ignoring them later."""
+    stripped_lines = (line.rstrip('\r\n').rstrip(',') + '\n' for line in lines)
+    return csv.reader(stripped_lines, delimiter=',', quotechar='"')
+
+def worker_processes(jobs):
+    """The number of worker processes to use for `jobs`, which is the number
+    itself, or one per cpu for 0 or None."""
+    if not jobs:
+        return os.cpu_count() or 1
+    if jobs < 0:
+        raise ValueError("The number of jobs cannot be negative: {}".format(jobs))
+    return jobs
+
+def read_poker_datafile(filename, equity_settings=None, jobs=1, chunk_size=16, cache=None,
+                        profile=False, pool=None):
+    """Yields the hands in the given csv file, in order. If `jobs` is more
+    than one, the hands are parsed and calculated by a pool of that many worker
+    processes, which are sent the rows in chunks of `chunk_size`, and 0 means
+    one per cpu, see worker_processes. Instead, an existing `pool` may be
+    given, which is left running. If a HandCache is given then only those
+    rows not found in it are calculated."""
+    jobs = worker_processes(jobs)
+    with open(filename, 'r', encoding='utf-8', errors='ignore') as input_file:
+        csvreader = read_rows(input_file)
+        parse_row = functools.partial(parse_hand, equity_settings=equity_settings, profile=profile)
+        own_pool = pool is None and jobs != 1
+        if own_pool:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs)
+
+        def calculate_rows(rows):
+            if pool is None:
+                return map(parse_row, rows)
+            # Note that imap, unlike imap_unordered, yields the results in the
+            # same order as the rows.
+            return pool.imap(parse_row, rows, chunk_size)
+
+        try:
+            if cache is None:
+                poker_hands = calculate_rows(csvreader)
+            else:
+                poker_hands = cache.cached_hands(csvreader, calculate_rows, equity_settings)
+            yield from report_poker_hands(poker_hands)
+        finally:
+            if own_pool:
+                pool.terminate()
+
+def read_poker_headers(filename):
+    """Yields the hands in the given csv file, parsed with `header_only`, see
+    parse_hand."""
     with open(filename, 'r', encoding='utf-8', errors='ignore') as input_file:
-        csvreader = csv.reader(input_file, delimiter=',', quotechar='"')
-        for row in csvreader:
-            poker_hand = parse_hand(row)
-            if poker_hand:
-                yield poker_hand
+        for row in read_rows(input_file):
+            hand = parse_hand(row, calculate=False, header_only=True)
+            if hand:
+                yield hand
+
+def report_poker_hands(poker_hands):
+    for poker_hand in poker_hands:
+        if poker_hand:
+            if poker_hand.error_report:
+                print(poker_hand.error_report)
+            yield poker_hand
+
+# This must be increased whenever a change to the way hands are parsed,
+# calculated or stored would change the results, since it invalidates any
+# HandCache.
+EVALUATOR_VERSION = 5
+
+class HandCache(object):
+    """An on-disk cache of calculated hands, keyed by a hash of the raw csv row,
+    so that recompiling after only the template has changed need not calculate
+    any hands at all. Once the cached hands take up more than `max_bytes` the
+    least recently used are evicted."""
+    def __init__(self, filename, max_bytes=256 * 1024 * 1024):
+        import sqlite3
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS hands (
+            key TEXT PRIMARY KEY, hand BLOB, size INTEGER, last_used REAL)""")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, row, equity_settings=None):
+        equity_settings = equity_settings or DEFAULT_EQUITY_SETTINGS
+        settings = vars(equity_settings)
+        contents = [EVALUATOR_VERSION, sorted(settings.items()),
+                    preflop_table_signature(equity_settings.preflop_table), row]
+        return hashlib.sha256(json.dumps(contents).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        result = self.connection.execute("SELECT hand FROM hands WHERE key = ?", (key,)).fetchone()
+        if result is None:
+            self.misses += 1
+            return None
+        try:
+            hand = pickle.loads(result[0])
+        except Exception:
+            # An entry written by an incompatible version of the program, or
+            # corrupted, is calculated again.
+            self.connection.execute("DELETE FROM hands WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute("UPDATE hands SET last_used = ? WHERE key = ?", (time.time(), key))
+        return hand
+
+    def put(self, key, hand):
+        # The timings are only meaningful for the run in which the hand was
+        # calculated, so they are not cached.
+        timings, hand.timings = hand.timings, None
+        data = pickle.dumps(hand, protocol=pickle.HIGHEST_PROTOCOL)
+        hand.timings = timings
+        self.connection.execute("INSERT OR REPLACE INTO hands VALUES (?, ?, ?, ?)",
+                                (key, data, len(data), time.time()))
+
+    def evict(self):
+        total_size, = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM hands").fetchone()
+        if total_size <= self.max_bytes:
+            return
+        evicted = self.connection.execute("SELECT key, size FROM hands ORDER BY last_used")
+        keys = []
+        for key, size in evicted:
+            if total_size <= self.max_bytes:
+                break
+            keys.append((key,))
+            total_size -= size
+        self.connection.executemany("DELETE FROM hands WHERE key = ?", keys)
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+    def contains(self, key):
+        return self.connection.execute("SELECT 1 FROM hands WHERE key = ?", (key,)).fetchone() is not None
+
+    def cached_hands(self, rows, calculate_rows, equity_settings=None, commit_interval=64):
+        """Yields a hand for each row, in order, taking them from the cache
+        where possible and otherwise from `calculate_rows`. That is called
+        once, with all of the rows missing from the cache, so that a pool of
+        worker processes can calculate them while the cached hands are being
+        yielded, rather than waiting for each block of rows to be looked up."""
+        rows = [(self.key(row, equity_settings), row) for row in rows]
+        cached = [self.contains(key) for key, _row in rows]
+        calculated = iter(calculate_rows([row for (_key, row), hit in zip(rows, cached) if not hit]))
+        for position, ((key, row), hit) in enumerate(zip(rows, cached)):
+            hand = self.get(key) if hit else None
+            if hand is None:
+                if hit:
+                    # The entry could not be unpickled, see get.
+                    hand = next(iter(calculate_rows([row])))
+                else:
+                    self.misses += 1
+                    hand = next(calculated)
+                if hand is not None:
+                    self.put(key, hand)
+            yield hand
+            if position % commit_interval == commit_interval - 1:
+                self.connection.commit()
+        self.connection.commit()
+
+
+# A snapshot holds whole sessions of calculated hands in a single binary file,
+# which can be memory mapped, so that they can be rendered again without
+# parsing or calculating anything. There is a table of hands, one of players
+# and one of events, each of which is stored column by column. The file starts
+# with SNAPSHOT_MAGIC, the version and the length of a json header, followed
+# by the header, which gives the number of rows of each table and the type,
+# width and position in the file of each column, and then the columns, each
+# aligned to 8 bytes. Numeric columns are arrays, with `width` values per row,
+# in which -1 stands for None. A 'str' column is an array of offsets into a
+# block of utf-8 text, and an empty string stands for None.
+SNAPSHOT_MAGIC = b'PHSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PREAMBLE = struct.Struct('<4sII')
+SNAPSHOT_ALIGNMENT = 8
+
+SNAPSHOT_COLUMNS = {
+    'hands': [
+        ('number', 'str', 1), ('starting_time', 'str', 1), ('title', 'str', 1),
+        ('ante', 'str', 1), ('small_blind', 'q', 1), ('big_blind', 'q', 1),
+        ('dealer', 'b', 1), ('small_blind_player', 'b', 1), ('big_blind_player', 'b', 1),
+        ('flop', 'b', 5), ('pot', 'q', 1), ('errors', 'str', 1), ('error_report', 'str', 1),
+        ('calculated', 'b', 1), ('players_start', 'q', 1), ('players_count', 'b', 1),
+        ('events_start', 'q', 1), ('events_count', 'q', 1),
+        ],
+    'players': [
+        ('hand', 'q', 1), ('index', 'b', 1), ('name', 'str', 1), ('straddle', 'q', 1),
+        ('pocket', 'b', 2), ('starting_stack', 'q', 1), ('ending_stack', 'q', 1),
+        ('hand_winner', 'b', 1), ('folded', 'b', 1), ('taking_part', 'b', 1),
+        ('best_hand_strength', 'q', 1),
+        ],
+    'events': [
+        ('hand', 'q', 1), ('starting_time', 'str', 1), ('action', 'b', 1), ('player', 'b', 1),
+        ('card', 'b', 1), ('amount', 'q', 1), ('pot', 'q', 1), ('display', 'b', 1),
+        ('bold', 'b', 1), ('description', 'str', 1), ('has_win_probabilities', 'b', 1),
+        ('win_percentages', 'd', NUMBER_OF_SEATS), ('win_margins', 'd', NUMBER_OF_SEATS),
+        ('win_samples', 'q', 1),
+        ],
+    }
+
+def padded(values, width, missing=-1):
+    values = list(values)
+    return values + [missing] * (width - len(values))
+
+def fitted(values, width, description, errors):
+    """The values padded to the width of a fixed width column, or if there
+    are too many, the first of them, in which case an error is added to the
+    given list, so that a malformed hand cannot shift the later rows."""
+    values = list(values)
+    if len(values) > width:
+        errors.append("{} has {} cards, only the first {} are kept in the snapshot.".format(
+            description, len(values), width))
+    return padded(values[:width], width)
+
+class SnapshotWriter(object):
+    """Gathers the columns of the hands added, see add_hand, and writes them
+    as a snapshot."""
+    def __init__(self):
+        self.columns = {
+            table: {name: [] if column_type == 'str' else array.array(column_type)
+                    for name, column_type, _width in columns}
+            for table, columns in SNAPSHOT_COLUMNS.items()}
+        self.number_of_rows = {table: 0 for table in SNAPSHOT_COLUMNS}
+
+    def add_row(self, table, **values):
+        columns = self.columns[table]
+        for name, column_type, width in SNAPSHOT_COLUMNS[table]:
+            value = values[name]
+            if column_type == 'str':
+                columns[name].append(value or '')
+            elif width == 1:
+                columns[name].append(-1 if value is None else value)
+            elif len(value) != width:
+                raise ValueError("The {} column takes {} values, not {}.".format(name, width, len(value)))
+            else:
+                columns[name].extend(value)
+        self.number_of_rows[table] += 1
+
+    def add_hand(self, hand):
+        hand_row = self.number_of_rows['hands']
+        events = hand.events
+        taking_part = getattr(hand, 'taking_part', None)
+        errors = list(hand.errors)
+        flop = fitted(hand.flop, 5, "The board", errors)
+        pockets = [fitted(player.pocket, 2, "The pocket of {} ({})".format(player.name, player.index), errors)
+                   for player in hand.players]
+        self.add_row(
+            'hands', number=hand.number, starting_time=hand.starting_time, title=hand.title,
+            ante=hand.ante, small_blind=hand.small_blind, big_blind=hand.big_blind,
+            dealer=hand.dealer, small_blind_player=hand.small_blind_player,
+            big_blind_player=hand.big_blind_player, flop=flop,
+            pot=events.pots[-1] if len(events) else 0, errors="\n".join(errors),
+            error_report=hand.error_report, calculated=taking_part is not None,
+            players_start=self.number_of_rows['players'], players_count=len(hand.players),
+            events_start=self.number_of_rows['events'], events_count=len(events))
+        taking_part_indexes = set(player.index for player in taking_part or [])
+        for player, pocket in zip(hand.players, pockets):
+            best_hand_rank = getattr(player, 'best_hand_rank', None)
+            self.add_row(
+                'players', hand=hand_row, index=player.index, name=player.name,
+                straddle=player.straddle, pocket=pocket,
+                starting_stack=player.starting_stack, ending_stack=player.ending_stack,
+                hand_winner=player.hand_winner, folded=player.folded,
+                taking_part=player.index in taking_part_indexes,
+                best_hand_strength=None if best_hand_rank is None else best_hand_rank.strength)
+        no_probabilities = array.array('d', [math.nan]) * NUMBER_OF_SEATS
+        for position in range(len(events)):
+            win_probabilities = events.win_probabilities[position]
+            if win_probabilities is None:
+                percentages = margins = no_probabilities
+                samples = None
+            else:
+                percentages = win_probabilities.percentages
+                margins = win_probabilities.margins or no_probabilities
+                samples = win_probabilities.samples
+            self.add_row(
+                'events', hand=hand_row, starting_time=events.starting_times[position],
+                action=events.actions[position], player=events.players[position],
+                card=events.cards[position], amount=events.amounts[position],
+                pot=events.pots[position], display=events.displays[position],
+                bold=events.bolds[position], description=events.descriptions[position],
+                has_win_probabilities=win_probabilities is not None,
+                win_percentages=percentages, win_margins=margins, win_samples=samples)
+
+    def add_hands(self, poker_hands):
+        """Adds each hand as it passes through."""
+        for hand in poker_hands:
+            self.add_hand(hand)
+            yield hand
+
+    def write(self, filename):
+        header = {'evaluator_version': EVALUATOR_VERSION, 'tables': {}}
+        blobs = []
+        offset = 0
+
+        def add_blob(blob):
+            nonlocal offset
+            blob_offset = offset
+            blobs.append(blob)
+            blobs.append(b'\0' * (-len(blob) % SNAPSHOT_ALIGNMENT))
+            offset += len(blob) + len(blobs[-1])
+            return blob_offset
+
+        for table, columns in SNAPSHOT_COLUMNS.items():
+            column_headers = {}
+            for name, column_type, width in columns:
+                values = self.columns[table][name]
+                column_header = {'type': column_type, 'width': width}
+                if column_type == 'str':
+                    data = bytearray()
+                    offsets = array.array('q', [0])
+                    for value in values:
+                        data += value.encode('utf-8')
+                        offsets.append(len(data))
+                    column_header['offset'] = add_blob(offsets.tobytes())
+                    column_header['data_offset'] = add_blob(bytes(data))
+                    column_header['data_size'] = len(data)
+                else:
+                    column_header['offset'] = add_blob(values.tobytes())
+                column_headers[name] = column_header
+            header['tables'][table] = {'rows': self.number_of_rows[table], 'columns': column_headers}
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        with open(filename, 'wb') as outfile:
+            outfile.write(SNAPSHOT_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+            outfile.write(header_bytes)
+            outfile.write(b'\0' * (snapshot_columns_start(len(header_bytes)) - outfile.tell()))
+            for blob in blobs:
+                outfile.write(blob)
+
+def snapshot_columns_start(header_size):
+    """The position in a snapshot of the first column, which the column
+    offsets in the header are relative to."""
+    start = SNAPSHOT_PREAMBLE.size + header_size
+    return start + -start % SNAPSHOT_ALIGNMENT
+
+class StringColumn(object):
+    __slots__ = ('offsets', 'data')
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return str(self.data[self.offsets[row]:self.offsets[row + 1]], 'utf-8')
+
+class Snapshot(object):
+    """A snapshot file, see SnapshotWriter, which is memory mapped. A single
+    column can be read with `column`, without decoding anything else, and
+    `hands` yields PokerHand objects equivalent to those written."""
+    def __init__(self, filename):
+        with open(filename, 'rb') as snapshot_file:
+            self.data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = SNAPSHOT_PREAMBLE.unpack_from(self.data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("{} is not a snapshot of this version.".format(filename))
+        header_end = SNAPSHOT_PREAMBLE.size + header_size
+        self.header = json.loads(self.data[SNAPSHOT_PREAMBLE.size:header_end].decode('utf-8'))
+        self.start = snapshot_columns_start(header_size)
+        self.buffer = memoryview(self.data)
+
+    def number_of_rows(self, table):
+        return self.header['tables'][table]['rows']
+
+    def __len__(self):
+        return self.number_of_rows('hands')
+
+    def column(self, table, name):
+        """Returns the column as a memoryview, for numeric columns, in which a
+        row's values are at [row * width:(row + 1) * width], or a StringColumn.
+        Neither the columns, nor the `hands` generator, may be used once the
+        snapshot is closed."""
+        column_header = self.header['tables'][table]['columns'][name]
+        rows = self.number_of_rows(table)
+        start = self.start + column_header['offset']
+        if column_header['type'] == 'str':
+            offsets = self.buffer[start:start + 8 * (rows + 1)].cast('q')
+            data_start = self.start + column_header['data_offset']
+            return StringColumn(offsets, self.buffer[data_start:data_start + column_header['data_size']])
+        item_size = array.array(column_header['type']).itemsize
+        size = item_size * rows * column_header['width']
+        return self.buffer[start:start + size].cast(column_header['type'])
+
+    def hands(self):
+        tables = {table: {name: self.column(table, name) for name, _type, _width in columns}
+                  for table, columns in SNAPSHOT_COLUMNS.items()}
+        for hand_row in range(len(self)):
+            yield self.load_hand(tables, hand_row)
+
+    @staticmethod
+    def load_hand(tables, row):
+        columns = tables['hands']
+        hand = PokerHand()
+        hand.number = columns['number'][row]
+        hand.starting_time = columns['starting_time'][row]
+        hand.title = columns['title'][row]
+        hand.ante = columns['ante'][row]
+        hand.small_blind = optional(columns['small_blind'][row])
+        hand.big_blind = optional(columns['big_blind'][row])
+        hand.dealer = optional(columns['dealer'][row])
+        hand.small_blind_player = optional(columns['small_blind_player'][row])
+        hand.big_blind_player = optional(columns['big_blind_player'][row])
+        hand.flop = [CARDS[code] for code in columns['flop'][5 * row:5 * row + 5] if code >= 0]
+        errors = columns['errors'][row]
+        hand.errors = errors.split("\n") if errors else []
+        hand.error_report = columns['error_report'][row] or None
+
+        player_columns = tables['players']
+        start = columns['players_start'][row]
+        taking_part = []
+        for player_row in range(start, start + columns['players_count'][row]):
+            player = Player(player_columns['index'][player_row])
+            player.name = player_columns['name'][player_row]
+            player.straddle = optional(player_columns['straddle'][player_row])
+            player.pocket = tuple(CARDS[code] for code in player_columns['pocket'][2 * player_row:2 * player_row + 2]
+                                  if code >= 0)
+            player.starting_stack = player_columns['starting_stack'][player_row]
+            player.ending_stack = player_columns['ending_stack'][player_row]
+            player.hand_winner = bool(player_columns['hand_winner'][player_row])
+            player.folded = bool(player_columns['folded'][player_row])
+            strength = player_columns['best_hand_strength'][player_row]
+            if strength >= 0:
+                player.best_hand_rank = HandRank(strength)
+            if player_columns['taking_part'][player_row]:
+                taking_part.append(player)
+            hand.players.append(player)
+        if columns['calculated'][row]:
+            hand.taking_part = taking_part
+
+        event_columns = tables['events']
+        start = columns['events_start'][row]
+        end = start + columns['events_count'][row]
+        events = EventList()
+        events.starting_times = [event_columns['starting_time'][position] for position in range(start, end)]
+        for attribute, name in [('actions', 'action'), ('players', 'player'), ('cards', 'card'),
+                                ('amounts', 'amount'), ('pots', 'pot'), ('displays', 'display'),
+                                ('bolds', 'bold')]:
+            getattr(events, attribute).extend(event_columns[name][start:end])
+        events.descriptions = [event_columns['description'][position] or None
+                               for position in range(start, end)]
+        for position in range(start, end):
+            win_probabilities = None
+            if event_columns['has_win_probabilities'][position]:
+                seats = slice(NUMBER_OF_SEATS * position, NUMBER_OF_SEATS * (position + 1))
+                percentages = array.array('d', event_columns['win_percentages'][seats])
+                margins = array.array('d', event_columns['win_margins'][seats])
+                samples = optional(event_columns['win_samples'][position])
+                if all(math.isnan(margin) for margin in margins):
+                    margins = None
+                win_probabilities = WinProbabilities.from_seat_arrays(percentages, margins, samples)
+            events.win_probabilities.append(win_probabilities)
+        hand._events = events
+        return hand
+
+    def close(self):
+        self.buffer.release()
+        try:
+            self.data.close()
+        except BufferError:
+            # Some columns are still referenced, the mapping is closed once
+            # they are garbage collected.
+            pass
+
+def is_snapshot(filename):
+    with open(filename, 'rb') as infile:
+        return infile.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+STREETS = ['preflop', 'flop', 'turn', 'river']
+
+def street_of_board(number_of_cards):
+    return {0: 0, 3: 1, 4: 2, 5: 3}.get(number_of_cards, 0)
+
+def time_in_seconds(starting_time):
+    seconds = 0
+    for part in starting_time.split(':'):
+        seconds = 60 * seconds + int(part)
+    return seconds
+
+def index_filename(output_filename):
+    return output_filename + '.index.json'
+
+class HandIndex(object):
+    """An index of the hands of a session, with which they can be found by
+    the players taking part and the street each reached, the class of the
+    winning hand at a showdown, the final pot and the starting time, without
+    reading the csv file again, see query_hands.py.
+
+    Each hand is identified by its position in `hands`, which holds a short
+    summary of it, including the file it was rendered to. The players, hand
+    classes and streets map to the positions of their hands, in order, and
+    the pots and starting times are the positions ordered by those values,
+    so that a range can be found by bisection."""
+    VERSION = 1
 
+    def __init__(self):
+        self.hands = []
+        # Player names map to [position, street reached] pairs.
+        self.players = defaultdict(list)
+        self.hand_classes = defaultdict(list)
+        self.streets = defaultdict(list)
+        # The positions ordered by pot, and by starting time, along with those
+        # values, see ordered.
+        self.orders = {}
+
+    def add_hand(self, hand, filename=None):
+        position = len(self.hands)
+        events = hand.events
+        pot = events.pots[-1] if len(events) else 0
+        hand_street = street_of_board(len(hand.flop))
+        # Players who fold reach only the street on which they fold.
+        streets_reached = {}
+        board_cards = 0
+        for event in events:
+            if event.action == 'BOARD':
+                board_cards += 1
+            elif event.action == 'FOLD':
+                streets_reached[event.player] = street_of_board(board_cards)
+        taking_part = set(player.index for player in getattr(hand, 'taking_part', None) or [])
+        for player in hand.players:
+            street = streets_reached.get(player.index, hand_street if player.index in taking_part else 0)
+            self.players[player.name].append([position, street])
+        strengths = [player.best_hand_rank.strength for player in hand.players
+                     if player.hand_winner and getattr(player, 'best_hand_rank', None) is not None]
+        hand_class = HandClass(strength_hand_class(max(strengths))).name if strengths else None
+        if hand_class is not None:
+            self.hand_classes[hand_class].append(position)
+        self.streets[STREETS[hand_street]].append(position)
+        self.hands.append({
+            'number': hand.number, 'starting_time': hand.starting_time, 'title': hand.title,
+            'pot': pot, 'hand_class': hand_class, 'street': STREETS[hand_street], 'file': filename,
+            })
+        self.orders = {}
+
+    def add_hands(self, poker_hands, filename_of=None):
+        """Adds each hand as it passes through, `filename_of` gives the file a
+        hand is rendered to from its position."""
+        for hand in poker_hands:
+            self.add_hand(hand, filename_of(len(self.hands)) if filename_of else None)
+            yield hand
+
+    def save(self, filename):
+        contents = {
+            'version': self.VERSION,
+            'hands': self.hands,
+            'players': self.players,
+            'hand_classes': self.hand_classes,
+            'streets': self.streets,
+            'pots': self.ordered('pot')[0],
+            'starting_times': self.ordered('starting_time')[0],
+            }
+        with open(filename, 'w') as outfile:
+            json.dump(contents, outfile)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as infile:
+            contents = json.load(infile)
+        if contents.get('version') != cls.VERSION:
+            raise ValueError("{} is not a hand index of this version.".format(filename))
+        index = cls()
+        index.hands = contents['hands']
+        index.players.update(contents['players'])
+        index.hand_classes.update(contents['hand_classes'])
+        index.streets.update(contents['streets'])
+        for name, positions in [('pot', contents['pots']), ('starting_time', contents['starting_times'])]:
+            index.orders[name] = (positions, [index.sort_value(name, position) for position in positions])
+        return index
+
+    def sort_value(self, name, position):
+        value = self.hands[position][name]
+        if name == 'starting_time':
+            # Hands whose header could not be parsed have no starting time.
+            if value is None:
+                return -1
+            try:
+                return time_in_seconds(value)
+            except ValueError:
+                return -1
+        return value
+
+    def ordered(self, name):
+        """The positions of the hands ordered by the named value, and the
+        values in that order."""
+        if name not in self.orders:
+            positions = sorted(range(len(self.hands)), key=lambda position: self.sort_value(name, position))
+            self.orders[name] = (positions, [self.sort_value(name, position) for position in positions])
+        return self.orders[name]
+
+    def in_range(self, name, low, high):
+        """The positions of the hands with the named value from low to high,
+        either of which may be None."""
+        positions, values = self.ordered(name)
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = len(values) if high is None else bisect.bisect_right(values, high)
+        return set(positions[start:end])
+
+    def query(self, player=None, street=None, hand_class=None, min_pot=None, max_pot=None,
+              start=None, end=None):
+        """Returns the summaries of the hands matching all of the given
+        conditions, in order. If a player is given then it is the street that
+        player reached which must be at least `street`, otherwise that of the
+        hand. The `start` and `end` times are given as H:MM:SS."""
+        candidates = []
+        minimum_street = STREETS.index(street) if street is not None else 0
+        if player is not None:
+            candidates.append(set(position for position, reached in self.players.get(player, [])
+                                  if reached >= minimum_street))
+        elif street is not None:
+            candidates.append(set(position for name in STREETS[minimum_street:]
+                                  for position in self.streets.get(name, [])))
+        if hand_class is not None:
+            candidates.append(set(self.hand_classes.get(hand_class, [])))
+        if min_pot is not None or max_pot is not None:
+            candidates.append(self.in_range('pot', min_pot, max_pot))
+        if start is not None or end is not None:
+            candidates.append(self.in_range(
+                'starting_time', None if start is None else time_in_seconds(start),
+                None if end is None else time_in_seconds(end)))
+        if not candidates:
+            return list(self.hands)
+        positions = set.intersection(*candidates)
+        return [self.hands[position] for position in sorted(positions)]
+
+
+import argparse
 import os
 import sys
 
-def compile_poker_hands_html(input_filename, output_filename):
-    print("Recompile commencing.")
-    template_relative_load_path = '.'
+def resource_base_path():
+    """The directory of the files shipped with the program, the templates and
+    the preflop table, whatever the working directory."""
     try:
         # PyInstaller creates a temp folder and stores path in _MEIPASS
-        template_base_path = sys._MEIPASS
+        return sys._MEIPASS
     except Exception:
-        template_base_path = os.path.abspath(".")
+        return os.path.dirname(os.path.abspath(__file__))
+
+def cache_directory():
+    """The directory of the caches which persist between runs, the compiled
+    templates and the hand evaluation tables, or None if it cannot be created.
+    It is the user's rather than alongside the program since, when frozen,
+    the program is unpacked afresh on each run. Setting POKER_HANDS_CACHE to
+    an empty string disables the caches."""
+    directory = os.environ.get('POKER_HANDS_CACHE')
+    if directory is None:
+        base = (os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME')
+                or os.path.join(os.path.expanduser('~'), '.cache'))
+        directory = os.path.join(base, 'poker-hands')
+    if not directory:
+        return None
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    return directory
+
+def get_template_environment():
+    import jinja2
+    template_relative_load_path = '.'
+    template_base_path = resource_base_path()
 
     template_load_path = os.path.join(template_base_path, template_relative_load_path)
 
-    env = jinja2.Environment(
+    # Jinja checks each cached template against its source, so an edited
+    # template is compiled again.
+    directory = cache_directory()
+    bytecode_cache = jinja2.FileSystemBytecodeCache(directory) if directory else None
+    return jinja2.Environment(
         loader=jinja2.FileSystemLoader(template_load_path),
-        autoescape=jinja2.select_autoescape(['html', 'xml'])
+        autoescape=jinja2.select_autoescape(['html', 'xml']),
+        bytecode_cache=bytecode_cache,
     )
-    template = env.get_template('poker-hands.jinja')
-
-    poker_hands = read_poker_datafile(input_filename)
-
 
+# The number of rendered fragments the template stream gathers up before
+# each write to the output file.
+DEFAULT_BUFFER_SIZE = 64
+
+def write_html(template, output_filename, buffer_size=DEFAULT_BUFFER_SIZE, **context):
+    """Renders the template to the given file, writing out the html as it is
+    generated, rather than building the whole document as one string first.
+    Since the hands are read lazily, each is written before the next is even
+    parsed."""
+    stream = template.stream(**context)
+    stream.enable_buffering(buffer_size)
     with open(output_filename, 'w') as outfile:
-        outfile.write(template.render(
-            poker_hands=poker_hands,
-            input_filename=input_filename,
-            date=datetime.date.today()
-            ))
+        stream.dump(outfile)
+
+
+def page_filename(output_filename, page_number):
+    root, extension = os.path.splitext(output_filename)
+    return "{}-{:03d}{}".format(root, page_number, extension or '.html')
+
+class ReportPage(object):
+    """One page of a paginated report. The attributes describing the hands on
+    the page are filled in as the page is rendered, so they are only complete
+    once it has been. That includes `next_filename`, which is why only the end
+    of a page links to the next one."""
+    def __init__(self, number, output_filename):
+        self.number = number
+        self.filename = page_filename(output_filename, number)
+        self.link = os.path.basename(self.filename)
+        self.index_link = os.path.basename(output_filename)
+        self.previous_link = os.path.basename(page_filename(output_filename, number - 1)) if number > 1 else None
+        self.next_link = None
+        self.number_of_hands = 0
+        self.first_hand = None
+        self.last_hand = None
+
+    def add_hand(self, hand):
+        if self.first_hand is None:
+            self.first_hand = hand.number
+            self.starting_time = hand.starting_time
+        self.last_hand = hand.number
+        self.ending_time = hand.ending_time
+        self.number_of_hands += 1
+
+def write_paginated_html(env, poker_hands, output_filename, page_size,
+                         buffer_size=DEFAULT_BUFFER_SIZE, **context):
+    """Writes the hands across as many pages of `page_size` hands as needed,
+    and an index of those pages to `output_filename`. Each page is streamed
+    as it is rendered, so only one hand beyond the current one is held."""
+    template = env.get_template('poker-hands.jinja')
+    hands = iter(poker_hands)
+    upcoming = next(hands, None)
+    pages = []
+    while upcoming is not None:
+        page = ReportPage(len(pages) + 1, output_filename)
+
+        def page_hands():
+            nonlocal upcoming
+            while upcoming is not None and page.number_of_hands < page_size:
+                hand = upcoming
+                page.add_hand(hand)
+                yield hand
+                upcoming = next(hands, None)
+            if upcoming is not None:
+                page.next_link = os.path.basename(page_filename(output_filename, page.number + 1))
+
+        write_html(template, page.filename, buffer_size, poker_hands=page_hands(), page=page, **context)
+        pages.append(page)
+
+    index_template = env.get_template('poker-hands-index.jinja')
+    write_html(index_template, output_filename, buffer_size, pages=pages, **context)
+    return pages
+
+# The comment in poker-hands.jinja which immediately follows the last hand.
+END_OF_HANDS_MARKER = '<!-- end of hands -->'
+
+class IncrementalHtmlFile(object):
+    """An html file to which hands can be appended without re-rendering those
+    already in it. The file is written as the template's html up to the end of
+    hands marker, then each hand's html, then the rest of the template. New
+    hands are written over the rest of the template, which is then written
+    again after them, so the cost of adding hands does not depend on how many
+    hands there are already. Provisional hands can be shown after them, which
+    are written over by whatever is added next."""
+    def __init__(self, template, filename, page=None, **context):
+        self.template = template
+        self.filename = filename
+        self.page = page
+        self.context = context
+        self.module = template.make_module(dict(context, page=page))
+        header, footer = self.render_header_and_footer()
+        header = header.encode('utf-8')
+        self.footer_offset = len(header)
+        with open(filename, 'wb') as outfile:
+            outfile.write(header)
+            outfile.write(footer.encode('utf-8'))
+
+    def render_header_and_footer(self):
+        html = self.template.render(poker_hands=[], page=self.page, **self.context)
+        marker_index = html.index(END_OF_HANDS_MARKER)
+        return html[:marker_index], html[marker_index:]
+
+    def add_hands(self, hands, provisional=()):
+        fragments = []
+        for hand in hands:
+            if self.page is not None:
+                self.page.add_hand(hand)
+            fragments.append(str(self.module.display_hand(hand)))
+        provisional_fragments = [str(self.module.display_hand(hand)) for hand in provisional]
+        self.rewrite_footer("\n".join(fragments).encode('utf-8'),
+                            "\n".join(provisional_fragments).encode('utf-8'))
+
+    def rewrite_footer(self, new_hands=b'', provisional=b''):
+        _header, footer = self.render_header_and_footer()
+        with open(self.filename, 'r+b') as outfile:
+            outfile.seek(self.footer_offset)
+            outfile.write(new_hands)
+            outfile.write(provisional)
+            outfile.write(footer.encode('utf-8'))
+            outfile.truncate()
+        self.footer_offset += len(new_hands)
+
+class FollowedReport(object):
+    """The output of follow mode, either a single html file, or if a page size
+    is given, pages of hands and an index, in the same form as
+    write_paginated_html. Only the page currently being filled is written to
+    when hands are added (and the previous one when a new page is begun)."""
+    def __init__(self, env, output_filename, page_size=None, **context):
+        self.template = env.get_template('poker-hands.jinja')
+        self.index_template = env.get_template('poker-hands-index.jinja')
+        self.output_filename = output_filename
+        self.page_size = page_size
+        self.context = context
+        self.pages = []
+        if page_size:
+            self.current = None
+            self.write_index()
+        else:
+            self.current = IncrementalHtmlFile(self.template, output_filename, **context)
+
+    def new_page(self):
+        page = ReportPage(len(self.pages) + 1, self.output_filename)
+        if self.current is not None:
+            self.current.page.next_link = page.link
+            self.current.rewrite_footer()
+        self.pages.append(page)
+        self.current = IncrementalHtmlFile(self.template, page.filename, page=page, **self.context)
+
+    def add_hands(self, hands, provisional=()):
+        """Adds the hands, followed by the `provisional` ones, which replace
+        those given last time and are not counted as part of their page."""
+        if not self.page_size:
+            self.current.add_hands(hands, provisional)
+            return
+        hands = list(hands)
+        if not hands and self.current is None:
+            if not provisional:
+                return
+            self.new_page()
+        if not hands:
+            self.current.add_hands([], provisional)
+        while hands:
+            if self.current is None or self.current.page.number_of_hands >= self.page_size:
+                self.new_page()
+            space = self.page_size - self.current.page.number_of_hands
+            # The provisional hands go at the end of the last page written to,
+            # even if it is full, until they are added for good.
+            self.current.add_hands(hands[:space], provisional if len(hands) <= space else ())
+            hands = hands[space:]
+        self.write_index()
+
+    def write_index(self):
+        write_html(self.index_template, self.output_filename, pages=self.pages, **self.context)
+
+def follow_poker_datafile(input_filename, output_filename, equity_settings=None,
+                          page_size=None, poll_interval=1.0, cache=None, statistics=False):
+    """Keeps the html output up to date with a csv file which is being appended
+    to, for example during a live session, until interrupted. Only the rows
+    appended since the last update are read, parsed and calculated, and their
+    hands are added to the output with an IncrementalHtmlFile. Rows are only
+    read for good once their line is complete, but an unterminated last row
+    which parses as a complete hand is shown provisionally, and replaced when
+    more data arrives, since the exporter need not end the file with a
+    newline."""
+    env = get_template_environment()
+    session = session_statistics.SessionStatistics() if statistics else None
+    context = dict(input_filename=input_filename, date=datetime.date.today(), statistics=session)
+    parse_row = functools.partial(parse_hand, equity_settings=equity_settings)
+
+    def calculate_rows(rows):
+        return map(parse_row, rows)
+
+    def provisional_hands(data):
+        # Neither cached nor counted in the statistics, since the row may not
+        # have been completely written yet.
+        rows = read_rows(data.decode('utf-8', errors='ignore').splitlines())
+        return [hand for hand in calculate_rows(rows) if hand.error_report is None and not hand.errors]
+
+    report = FollowedReport(env, output_filename, page_size, **context)
+    offset = 0
+    unterminated = b''
+    print("Following {}.".format(input_filename))
+    try:
+        while True:
+            size = os.stat(input_filename).st_size
+            if size < offset:
+                print("The input file has been truncated, starting again.")
+                if session is not None:
+                    session = context['statistics'] = session_statistics.SessionStatistics()
+                report = FollowedReport(env, output_filename, page_size, **context)
+                offset = 0
+                unterminated = b''
+            if size > offset:
+                with open(input_filename, 'rb') as input_file:
+                    input_file.seek(offset)
+                    data = input_file.read(size - offset)
+                complete = data.rfind(b'\n') + 1
+                if complete or data != unterminated:
+                    hands = []
+                    if complete:
+                        offset += complete
+                        lines = data[:complete].decode('utf-8', errors='ignore').splitlines()
+                        rows = read_rows(lines)
+                        if cache is None:
+                            poker_hands = calculate_rows(rows)
+                        else:
+                            poker_hands = cache.cached_hands(rows, calculate_rows, equity_settings)
+                        hands = list(report_poker_hands(poker_hands))
+                        if session is not None:
+                            for hand in hands:
+                                session.add_hand(hand)
+                    unterminated = data[complete:]
+                    provisional = provisional_hands(unterminated) if unterminated else []
+                    report.add_hands(hands, provisional)
+                    if cache is not None:
+                        cache.connection.commit()
+                    if hands:
+                        print("Added {} hand(s) to {}.".format(len(hands), output_filename))
+                    if provisional:
+                        print("Showing the unterminated last row of {} provisionally.".format(input_filename))
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("No longer following {}.".format(input_filename))
+
+class Profiler(object):
+    """Gathers the timings recorded on each hand when profiling (see
+    parse_hand), adding the time taken to render it, and writes a summary
+    in which the slowest hands, with the work done for each of their events,
+    come first."""
+    def __init__(self, number_of_slowest=20):
+        self.number_of_slowest = number_of_slowest
+        self.totals = {'parse': 0.0, 'calculate': 0.0, 'equity': 0.0, 'render': 0.0}
+        self.number_of_hands = 0
+        self.boards_enumerated = 0
+        self.hands_evaluated = 0
+        # The hits and misses of the memos, see LRUMemo, totalled from each
+        # hand since with several jobs each worker process has its own.
+        self.memo = {tier: {'hits': 0, 'misses': 0} for tier in ('equities',)}
+        # A heap of the slowest hands so far, the counter breaks ties.
+        self.slowest = []
+        self.counter = itertools.count()
+        self.start = time.perf_counter()
+
+    def timed(self, poker_hands):
+        """Wraps the hands being rendered, since the template asks for the next
+        hand only once it has rendered the current one, the time in between is
+        the time taken to render it."""
+        for hand in poker_hands:
+            start = time.perf_counter()
+            yield hand
+            self.add_hand(hand, time.perf_counter() - start)
+
+    def add_hand(self, hand, render_time):
+        timings = hand.timings or {'parse': 0.0, 'calculate': 0.0, 'equity': 0.0, 'events': []}
+        timings['render'] = render_time
+        self.number_of_hands += 1
+        for stage in self.totals:
+            self.totals[stage] += timings[stage]
+        for event in timings['events']:
+            self.boards_enumerated += event['boards_enumerated']
+            self.hands_evaluated += event['hands_evaluated']
+        for tier, counts in timings.get('memo', {}).items():
+            for count, value in counts.items():
+                self.memo[tier][count] += value
+        total = timings['parse'] + timings['calculate'] + timings['render']
+        summary = dict(timings, number=hand.number, starting_time=hand.starting_time,
+                       total=total, cached=hand.timings is None)
+        entry = (total, next(self.counter), summary)
+        if len(self.slowest) < self.number_of_slowest:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def summary(self):
+        return {
+            'wall_time': time.perf_counter() - self.start,
+            'number_of_hands': self.number_of_hands,
+            'totals': self.totals,
+            'boards_enumerated': self.boards_enumerated,
+            'hands_evaluated': self.hands_evaluated,
+            'memo': self.memo,
+            'slowest_hands': [summary for _total, _count, summary in sorted(self.slowest, reverse=True)],
+            }
+
+    def write(self, filename, cprofile=None):
+        summary = self.summary()
+        if cprofile is not None:
+            summary['cprofile'] = cprofile_summary(cprofile)
+        with open(filename, 'w') as outfile:
+            json.dump(summary, outfile, indent=2)
+
+def cprofile_summary(cprofile, number_of_functions=30):
+    """The functions with the largest cumulative time, from a cProfile.Profile.
+    Note that with several jobs, this only covers the main process."""
+    import pstats
+    stats = pstats.Stats(cprofile).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [{'function': "{}:{}({})".format(*function), 'calls': calls,
+             'total_time': total_time, 'cumulative_time': cumulative_time}
+            for function, (_primitive_calls, calls, total_time, cumulative_time, _callers)
+            in functions[:number_of_functions]]
+
+def render_poker_hands(env, poker_hands, output_filename, page_size=None,
+                       buffer_size=DEFAULT_BUFFER_SIZE, **context):
+    if page_size:
+        write_paginated_html(env, poker_hands, output_filename, page_size, buffer_size, **context)
+    else:
+        template = env.get_template('poker-hands.jinja')
+        write_html(template, output_filename, buffer_size, poker_hands=poker_hands, **context)
+
+def index_hands(hand_index, poker_hands, output_filename, page_size=None):
+    """Adds the hands to the HandIndex as they pass, with the file each is
+    rendered to by render_poker_hands."""
+    if page_size:
+        def filename_of(position):
+            return os.path.basename(page_filename(output_filename, position // page_size + 1))
+    else:
+        def filename_of(position):
+            return os.path.basename(output_filename)
+    return hand_index.add_hands(poker_hands, filename_of)
+
+def compile_poker_hands_html(input_filename, output_filename, equity_settings=None, jobs=1,
+                             page_size=None, buffer_size=DEFAULT_BUFFER_SIZE, cache=None,
+                             profiler=None, snapshot_filename=None, index=False,
+                             statistics=False):
+    """The input may be a csv file or a snapshot, see Snapshot. If a
+    `snapshot_filename` is given then the hands are also written to that, and
+    if `index` is True a HandIndex of them is saved next to the output. If
+    `statistics` is True the per player statistics of the session are shown
+    after the hands, or on the index of the pages."""
+    print("Recompile commencing.")
+    env = get_template_environment()
+    if is_snapshot(input_filename):
+        poker_hands = Snapshot(input_filename).hands()
+    else:
+        poker_hands = read_poker_datafile(input_filename, equity_settings, jobs=jobs, cache=cache,
+                                          profile=profiler is not None)
+    snapshot_writer = None
+    if snapshot_filename is not None:
+        snapshot_writer = SnapshotWriter()
+        poker_hands = snapshot_writer.add_hands(poker_hands)
+    hand_index = None
+    if index:
+        hand_index = HandIndex()
+        poker_hands = index_hands(hand_index, poker_hands, output_filename, page_size)
+    session = None
+    if statistics:
+        session = session_statistics.SessionStatistics()
+        poker_hands = session.add_hands(poker_hands)
+    if profiler is not None:
+        poker_hands = profiler.timed(poker_hands)
+    context = dict(input_filename=input_filename, date=datetime.date.today(), statistics=session)
+    render_poker_hands(env, poker_hands, output_filename, page_size, buffer_size, **context)
+    if cache is not None:
+        print("Hands taken from the cache: {}, calculated: {}.".format(cache.hits, cache.misses))
+    if snapshot_writer is not None:
+        snapshot_writer.write(snapshot_filename)
+        print("Snapshot written to {}.".format(snapshot_filename))
+    if hand_index is not None:
+        hand_index.save(index_filename(output_filename))
+        print("Index written to {}.".format(index_filename(output_filename)))
     print("Recompile complete.")
 
 
-def get_argument(index, default):
-    if len(sys.argv) > index:
-        return sys.argv[index]
-    return default
+class BatchEntry(object):
+    """The summary of one input file of a batch, see compile_batch, which is
+    kept in the batch's manifest so that it can be listed on the batch index
+    without reading the file again if it has not changed."""
+    FIELDS = ('input_filename', 'output_filename', 'key', 'number_of_hands', 'first_hand',
+              'last_hand', 'starting_time', 'ending_time', 'statistics')
+
+    def __init__(self, input_filename, output_filename, key):
+        self.input_filename = input_filename
+        self.output_filename = output_filename
+        self.key = key
+        self.number_of_hands = 0
+        self.first_hand = None
+        self.last_hand = None
+        self.starting_time = None
+        self.ending_time = None
+        self.statistics = None
+        self.unchanged = False
+
+    @property
+    def title(self):
+        return self.input_filename
+
+    def add_hands(self, poker_hands):
+        for hand in poker_hands:
+            if self.first_hand is None:
+                self.first_hand = hand.number
+                self.starting_time = hand.starting_time
+            self.last_hand = hand.number
+            self.ending_time = hand.ending_time
+            self.number_of_hands += 1
+            yield hand
+
+    def as_dict(self):
+        values = {name: getattr(self, name) for name in self.FIELDS}
+        if self.statistics is not None:
+            values['statistics'] = self.statistics.as_dict()
+        return values
+
+    @classmethod
+    def from_dict(cls, values):
+        entry = cls(values['input_filename'], values['output_filename'], values['key'])
+        for name in cls.FIELDS:
+            setattr(entry, name, values[name])
+        if entry.statistics is not None:
+            entry.statistics = session_statistics.SessionStatistics.from_dict(entry.statistics)
+        return entry
+
+def batch_input_filenames(patterns):
+    """The csv files given by the patterns, each of which is a file, a glob
+    or a directory, which is searched for csv files."""
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            filenames.extend(sorted(glob.glob(os.path.join(pattern, '**', '*.csv'), recursive=True)))
+        elif glob.has_magic(pattern):
+            filenames.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            filenames.append(pattern)
+    unique = []
+    for filename in filenames:
+        if filename not in unique:
+            unique.append(filename)
+    return unique
+
+def file_hash(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as infile:
+        for block in iter(functools.partial(infile.read, 1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_filename(output_filename):
+    return output_filename + '.manifest.json'
+
+def compile_batch(patterns, output_filename, equity_settings=None, jobs=1, page_size=None,
+                  buffer_size=DEFAULT_BUFFER_SIZE, cache=None, statistics=False, force=False,
+                  index=False):
+    """Compiles each of the csv files given by the patterns, see
+    batch_input_filenames, to an html file of the same name in the directory
+    of `output_filename`, which becomes an index of them all. The hands of
+    every file are calculated by the same pool of worker processes, with the
+    same cache. If `index` is True a HandIndex of each file's hands is saved
+    next to its html file, so that query_hands.py can search the directory.
+
+    A manifest of the files compiled, including a hash of their contents, is
+    kept next to the index, and unless `force` is True, files which have not
+    changed since they were last compiled, with the same settings, template,
+    preflop table and version of the program, are skipped."""
+    env = get_template_environment()
+    output_directory = os.path.dirname(output_filename)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    equity_settings = equity_settings or DEFAULT_EQUITY_SETTINGS
+    settings = sorted(vars(equity_settings).items())
+    template_source, _filename, _uptodate = env.loader.get_source(env, 'poker-hands.jinja')
+    template_hash = hashlib.sha256(template_source.encode('utf-8')).hexdigest()
+    settings_json = json.dumps([EVALUATOR_VERSION, settings, page_size, statistics, template_hash,
+                                preflop_table_signature(equity_settings.preflop_table)])
+    manifest = {}
+    if os.path.exists(manifest_filename(output_filename)) and not force:
+        with open(manifest_filename(output_filename)) as infile:
+            manifest = json.load(infile)
+
+    def save_manifest():
+        with open(manifest_filename(output_filename), 'w') as outfile:
+            json.dump(manifest, outfile, indent=2)
+
+    entries = []
+    used_outputs = set()
+    jobs = worker_processes(jobs)
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs) if jobs != 1 else None
+    try:
+        for input_filename in batch_input_filenames(patterns):
+            stem = os.path.splitext(os.path.basename(input_filename))[0]
+            entry_output = os.path.join(output_directory, stem + '.html')
+            suffix = 1
+            while entry_output in used_outputs or os.path.abspath(entry_output) == os.path.abspath(output_filename):
+                suffix += 1
+                entry_output = os.path.join(output_directory, "{}-{}.html".format(stem, suffix))
+            used_outputs.add(entry_output)
+
+            try:
+                key = hashlib.sha256((file_hash(input_filename) + settings_json).encode('utf-8')).hexdigest()
+                previous = manifest.get(input_filename)
+                if (previous is not None and previous['key'] == key
+                        and previous['output_filename'] == entry_output and os.path.exists(entry_output)
+                        and (not index or os.path.exists(index_filename(entry_output)))):
+                    entry = BatchEntry.from_dict(previous)
+                    entry.unchanged = True
+                    print("{} is unchanged.".format(input_filename))
+                else:
+                    print("Compiling {} to {}.".format(input_filename, entry_output))
+                    entry = BatchEntry(input_filename, entry_output, key)
+                    poker_hands = entry.add_hands(read_poker_datafile(
+                        input_filename, equity_settings, jobs=jobs, cache=cache, pool=pool))
+                    hand_index = None
+                    if index:
+                        hand_index = HandIndex()
+                        poker_hands = index_hands(hand_index, poker_hands, entry_output, page_size)
+                    if statistics:
+                        entry.statistics = session_statistics.SessionStatistics()
+                        poker_hands = entry.statistics.add_hands(poker_hands)
+                    render_poker_hands(env, poker_hands, entry_output, page_size, buffer_size,
+                                       input_filename=input_filename, date=datetime.date.today(),
+                                       statistics=entry.statistics)
+                    if hand_index is not None:
+                        hand_index.save(index_filename(entry_output))
+                    manifest[input_filename] = entry.as_dict()
+                    save_manifest()
+            except OSError as error:
+                # One unreadable file leaves it out of the index, rather than
+                # losing the rest of the batch.
+                print("Could not compile {}, it is left out of the index: {}".format(input_filename, error))
+                manifest.pop(input_filename, None)
+                continue
+            entry.link = os.path.relpath(entry.output_filename, output_directory or '.')
+            entries.append(entry)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    combined = None
+    if statistics:
+        combined = session_statistics.SessionStatistics()
+        for entry in entries:
+            if entry.statistics is not None:
+                combined.merge(entry.statistics)
+    index_template = env.get_template('poker-hands-index.jinja')
+    write_html(index_template, output_filename, buffer_size, pages=entries, heading='File',
+               input_filename="{} file(s)".format(len(entries)), date=datetime.date.today(),
+               statistics=combined)
+    if cache is not None:
+        print("Hands taken from the cache: {}, calculated: {}.".format(cache.hits, cache.misses))
+    print("Index of {} file(s), {} unchanged, written to {}.".format(
+        len(entries), sum(entry.unchanged for entry in entries), output_filename))
+    return entries
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description="Compile a poker hands csv file into html.")
+    # The defaults are filled in by parse_arguments.
+    parser.add_argument('input_filename', nargs='?', default=None, help="Defaults to example.csv.")
+    parser.add_argument('output_filename', nargs='?', default=None, help="Defaults to poker-hands.html.")
+    parser.add_argument('-o', '--output', default=None, metavar='OUTPUT_FILENAME',
+                        help="The output, instead of the second argument. In batch mode, the index to write.")
+    defaults = DEFAULT_EQUITY_SETTINGS
+    parser.add_argument('--samples', type=int, default=defaults.max_samples,
+                        help="The maximum number of runouts sampled to estimate preflop win probabilities.")
+    parser.add_argument('--standard-error', type=float, default=defaults.target_standard_error,
+                        help="Stop sampling once every preflop win percentage has at most this standard error.")
+    parser.add_argument('--time-budget', type=float, default=defaults.time_budget,
+                        help="The maximum number of seconds spent estimating the win probabilities of one event.")
+    parser.add_argument('--seed', type=int, default=defaults.seed,
+                        help="The seed used for sampling runouts.")
+    parser.add_argument('--preflop-table', default=None,
+                        help="The table of exact heads up preflop win probabilities, see preflop_table.py, if it "
+                        "exists. Defaults to the {} shipped alongside this program.".format(defaults.preflop_table))
+    parser.add_argument('--hidden-hands', default=defaults.hidden_hands,
+                        help="Rather than leaving the players who never show their hand out of the win "
+                        "probabilities, take them to hold any hand in this range, for example random or "
+                        "\"22+, A2s+, KTo+\".")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="The number of worker processes used to calculate the hands, 0 means one per cpu.")
+    parser.add_argument('--page-size', type=int, default=None,
+                        help="Split the output into pages of this many hands, the output file becomes an index of the pages.")
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help="The number of rendered fragments gathered before each write to the output.")
+    parser.add_argument('--cache', default=None,
+                        help="A file in which to cache calculated hands between runs.")
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help="The maximum size of the cache, in megabytes.")
+    parser.add_argument('--snapshot', default=None,
+                        help="Also write the calculated hands to this snapshot file, which can be given as the input instead of a csv file.")
+    parser.add_argument('--index', action='store_true',
+                        help="Also write an index of the hands to <output>.index.json, see query_hands.py. In batch "
+                        "mode, one is written next to the html file of each input.")
+    parser.add_argument('--statistics', action='store_true',
+                        help="Show the per player statistics of the session after the hands.")
+    parser.add_argument('--batch', nargs='+', default=None, metavar='PATTERN',
+                        help="Compile every csv file given by these files, globs or directories, each to its own html file, and write an index of them to the output, given by --output.")
+    parser.add_argument('--force', action='store_true',
+                        help="In batch mode, compile every file, even those unchanged since the last batch.")
+    parser.add_argument('--follow', action='store_true',
+                        help="Keep running, adding the hands of any rows appended to the input file to the output. "
+                        "An unterminated last row is shown provisionally until more is written.")
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="In follow mode, the number of seconds between checks for appended rows.")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time each stage of each hand and write the slowest hands to <output>.profile.json.")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="With --profile, also run under cProfile, writing <output>.prof.")
+    return parser
+
+def parse_arguments(argv=None):
+    parser = get_argument_parser()
+    arguments = parser.parse_args(argv)
+    if arguments.jobs < 0:
+        parser.error("--jobs cannot be negative.")
+    if arguments.hidden_hands is not None:
+        try:
+            parse_hand_range(arguments.hidden_hands)
+        except ValueError as error:
+            parser.error(str(error))
+    if arguments.preflop_table is None:
+        arguments.preflop_table = DEFAULT_EQUITY_SETTINGS.preflop_table
+    elif arguments.preflop_table:
+        # A table given on the command line is relative to the working
+        # directory, rather than to the program like the default.
+        arguments.preflop_table = os.path.abspath(arguments.preflop_table)
+    if arguments.output is not None:
+        if arguments.output_filename is not None:
+            parser.error("The output is given both by --output and as an argument.")
+        arguments.output_filename = arguments.output
+    if arguments.batch:
+        if arguments.input_filename is not None:
+            parser.error("In batch mode the inputs are given by --batch and the index by --output, "
+                         "not as arguments.")
+        for pattern in arguments.batch:
+            if not (os.path.exists(pattern) or glob.has_magic(pattern)):
+                parser.error("--batch: {} is not a file, directory or glob. The index to write is given "
+                             "by --output.".format(pattern))
+        output_filename = os.path.abspath(arguments.output_filename or 'poker-hands.html')
+        if any(os.path.abspath(filename) == output_filename
+               for filename in batch_input_filenames(arguments.batch)):
+            parser.error("The index would overwrite one of the inputs: {}".format(arguments.output_filename))
+    # Options which only apply to compiling a single file, or which batch
+    # mode supports but follow mode does not.
+    mode = '--batch' if arguments.batch else '--follow' if arguments.follow else None
+    if mode is not None:
+        used = [('--follow', arguments.batch and arguments.follow),
+                ('--snapshot', arguments.snapshot is not None),
+                ('--profile', arguments.profile or arguments.cprofile),
+                ('--index', arguments.follow and arguments.index),
+                ('--jobs', arguments.follow and arguments.jobs != 1)]
+        for option, is_used in used:
+            if is_used:
+                parser.error("{} cannot be used with {}.".format(option, mode))
+    arguments.input_filename = arguments.input_filename or 'example.csv'
+    arguments.output_filename = arguments.output_filename or 'poker-hands.html'
+    return arguments
 
 if __name__ == '__main__':
-    input_filename = get_argument(1, 'example.csv')
-    output_filename = get_argument(2, 'poker-hands.html')
-    compile_poker_hands_html(input_filename, output_filename)
\ No newline at end of file
+    # Required for worker processes when running as a frozen executable.
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+    arguments = parse_arguments()
+    equity_settings = EquitySettings(
+        max_samples=arguments.samples,
+        target_standard_error=arguments.standard_error,
+        time_budget=arguments.time_budget,
+        seed=arguments.seed,
+        preflop_table=arguments.preflop_table,
+        hidden_hands=arguments.hidden_hands,
+        )
+    jobs = worker_processes(arguments.jobs)
+    cache = None
+    if arguments.cache:
+        cache = HandCache(arguments.cache, max_bytes=arguments.cache_size * 1024 * 1024)
+    try:
+        if arguments.batch:
+            compile_batch(arguments.batch, arguments.output_filename, equity_settings, jobs=jobs,
+                          page_size=arguments.page_size, buffer_size=arguments.buffer_size,
+                          cache=cache, statistics=arguments.statistics, force=arguments.force,
+                          index=arguments.index)
+        elif arguments.follow:
+            follow_poker_datafile(arguments.input_filename, arguments.output_filename,
+                                  equity_settings, page_size=arguments.page_size,
+                                  poll_interval=arguments.poll_interval, cache=cache,
+                                  statistics=arguments.statistics)
+        else:
+            profiler = Profiler() if arguments.profile else None
+            cprofile = None
+            if arguments.profile and arguments.cprofile:
+                import cProfile
+                cprofile = cProfile.Profile()
+            if cprofile is not None:
+                cprofile.enable()
+            compile_poker_hands_html(arguments.input_filename, arguments.output_filename,
+                                     equity_settings, jobs=jobs, page_size=arguments.page_size,
+                                     buffer_size=arguments.buffer_size, cache=cache,
+                                     profiler=profiler, snapshot_filename=arguments.snapshot,
+                                     index=arguments.index, statistics=arguments.statistics)
+            if cprofile is not None:
+                cprofile.disable()
+                cprofile.dump_stats(arguments.output_filename + '.prof')
+            if profiler is not None:
+                profile_filename = arguments.output_filename + '.profile.json'
+                profiler.write(profile_filename, cprofile)
+                print("Profile written to {}.".format(profile_filename))
+    finally:
+        if cache is not None:
+            cache.close()
\ No newline at end of file
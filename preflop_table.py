@@ -0,0 +1,162 @@
+"""Generates the table of exact heads up win probabilities before the flop
+which poker_hands.py looks up, see PreflopTable there, for example:
+
+    python preflop_table.py preflop-equity.bin
+
+Rather than enumerating the boards for each pair of pockets in turn, every
+board is visited once and all of the pockets are compared on it, which is
+much less work in total, since the strength of each pocket on a board is
+shared by all of the pairs it is in. Boards which differ only by a
+permutation of the suits are also only visited once, so that the whole table
+takes a few minutes to generate.
+
+numpy is required.
+"""
+import argparse
+import itertools
+import math
+import os
+import sys
+import time
+
+import numpy
+
+import poker_hands
+
+# Boards are identified while canonicalising them by their cards, sorted, as
+# the digits of a number in base 52.
+BOARD_DIGITS = 52 ** numpy.arange(4, -1, -1, dtype=numpy.int64)
+
+SUIT_MAPS = [numpy.array(suit_map) for suit_map in itertools.permutations(range(4))]
+
+
+def all_pockets():
+    """Every pocket, the row of each being its poker_hands.pocket_index."""
+    pockets = numpy.empty((poker_hands.NUMBER_OF_POCKETS, 2), dtype=numpy.int64)
+    for pocket in itertools.combinations(range(52), 2):
+        pockets[poker_hands.pocket_index(pocket)] = pocket
+    return pockets
+
+
+def map_card_suits(cards, suit_map):
+    return cards & ~3 | suit_map[cards & 3]
+
+
+def canonical_boards():
+    """The boards which are distinct up to a permutation of the suits, as an
+    array with a row of five cards each, and the number of boards each stands
+    for."""
+    boards = numpy.fromiter(itertools.chain.from_iterable(itertools.combinations(range(52), 5)),
+                            dtype=numpy.int64, count=5 * math.comb(52, 5)).reshape(-1, 5)
+    keys = None
+    for suit_map in SUIT_MAPS:
+        mapped = numpy.sort(map_card_suits(boards, suit_map), axis=1)
+        mapped_keys = mapped @ BOARD_DIGITS
+        keys = mapped_keys if keys is None else numpy.minimum(keys, mapped_keys)
+    keys, counts = numpy.unique(keys, return_counts=True)
+    return keys[:, None] // BOARD_DIGITS % 52, counts
+
+
+def count_wins(pockets, boards, weights, batch_size=64, report=None):
+    """Returns a matrix of, for each pair of pockets, the weighted number of
+    the given boards on which the first wins or ties against the second. The
+    entries for pockets which share a card are meaningless."""
+    number_of_pockets = len(pockets)
+    # A separate count for each weight, since adding a boolean matrix is much
+    # quicker than multiplying it first.
+    counts = {weight: numpy.zeros((number_of_pockets, number_of_pockets), dtype=numpy.int32)
+              for weight in numpy.unique(weights).tolist()}
+    compared = numpy.empty((number_of_pockets, number_of_pockets), dtype=bool)
+    for start in range(0, len(boards), batch_size):
+        batch = boards[start:start + batch_size]
+        # The pockets which share no card with each board.
+        valid = ~(pockets[None, :, :, None] == batch[:, None, None, :]).any(axis=(2, 3))
+        rows = [numpy.hstack([pockets[board_valid], numpy.broadcast_to(board, (board_valid.sum(), 5))])
+                for board, board_valid in zip(batch, valid)]
+        strengths = poker_hands.hand_strength_array(numpy.concatenate(rows))
+        offset = 0
+        for board_valid, weight in zip(valid, weights[start:start + batch_size].tolist()):
+            board_strengths = strengths[offset:offset + board_valid.sum()]
+            offset += len(board_strengths)
+            # Pockets which share a card with the board neither win nor lose.
+            heroes = numpy.full(number_of_pockets, -1, dtype=numpy.int64)
+            heroes[board_valid] = board_strengths
+            villains = numpy.full(number_of_pockets, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+            villains[board_valid] = board_strengths
+            numpy.greater_equal(heroes[:, None], villains[None, :], out=compared)
+            counts[weight] += compared
+        if report is not None:
+            report(min(start + batch_size, len(boards)), len(boards))
+    total = numpy.zeros((number_of_pockets, number_of_pockets), dtype=numpy.int64)
+    for weight, weight_counts in counts.items():
+        total += weight * weight_counts.astype(numpy.int64)
+    return total
+
+
+def suit_map_permutations(pockets):
+    """For each permutation of the suits, the index of the pocket each pocket
+    is mapped to."""
+    permutations = []
+    for suit_map in SUIT_MAPS:
+        mapped = numpy.sort(map_card_suits(pockets, suit_map), axis=1)
+        permutations.append(mapped[:, 1] * (mapped[:, 1] - 1) // 2 + mapped[:, 0])
+    return permutations
+
+
+def representative_pocket(hand_class):
+    """The pocket of the class whose suits are already canonical, see
+    poker_hands.canonical_suit_map."""
+    high, low, suited = hand_class
+    return [(high - 2) * 4, (low - 2) * 4 + (0 if suited else 1)]
+
+
+def table_entries(pockets, wins):
+    """The entries of the table, as an array with a row per hero class and
+    villain pocket, of the hero's and the villain's wins. `wins` counts each
+    board once for every permutation of its suits which is a canonical board,
+    so averaging over the permutations of the pockets gives the number of
+    boards."""
+    number_of_pockets = len(pockets)
+    heroes = numpy.array([poker_hands.pocket_index(representative_pocket(hand_class))
+                          for hand_class in poker_hands.STARTING_HAND_CLASSES])
+    hero_wins = numpy.zeros((len(heroes), number_of_pockets), dtype=numpy.int64)
+    villain_wins = numpy.zeros((len(heroes), number_of_pockets), dtype=numpy.int64)
+    for permutation in suit_map_permutations(pockets):
+        hero_wins += wins[permutation[heroes]][:, permutation]
+        villain_wins += wins[permutation][:, permutation[heroes]].T
+    assert not (hero_wins % len(SUIT_MAPS)).any() and not (villain_wins % len(SUIT_MAPS)).any()
+    entries = numpy.stack([hero_wins, villain_wins], axis=2) // len(SUIT_MAPS)
+    shares_card = (pockets[heroes][:, None, :, None] == pockets[None, :, None, :]).any(axis=(2, 3))
+    entries[shares_card] = poker_hands.PREFLOP_TABLE_MISSING
+    return entries
+
+
+def generate(filename):
+    start = time.perf_counter()
+    pockets = all_pockets()
+    boards, weights = canonical_boards()
+    print("{} distinct boards found after {:.0f}s.".format(len(boards), time.perf_counter() - start))
+
+    def report(done, total):
+        if done % 6400 == 0 or done == total:
+            print("{}/{} boards after {:.0f}s.".format(done, total, time.perf_counter() - start))
+    wins = count_wins(pockets, boards, weights, report=report)
+    entries = table_entries(pockets, wins)
+    table = poker_hands.PreflopTable.create(filename)
+    table.data[poker_hands.PreflopTable.offset(0):] = entries.astype('<u4').tobytes()
+    table.data.flush()
+    table.close()
+    print("Written to {} after {:.0f}s.".format(filename, time.perf_counter() - start))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the table of heads up preflop win probabilities.")
+    parser.add_argument('output_filename', nargs='?', default=os.path.join(
+        poker_hands.resource_base_path(), poker_hands.DEFAULT_EQUITY_SETTINGS.preflop_table))
+    arguments = parser.parse_args(argv)
+    generate(arguments.output_filename)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Finds hands in the indexes written by `poker_hands.py --index`, see
+HandIndex, without reading the csv files again, for example:
+
+    python query_hands.py season/ --player HELLMUTH --street river
+    python query_hands.py poker-hands.html.index.json --min-pot 5000 --hand-class full_house
+
+Each argument may be an index file, a directory, which is searched for index
+files, or a glob.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import poker_hands
+
+
+def index_filenames(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, '**', '*.index.json'), recursive=True)))
+        elif glob.has_magic(path):
+            filenames.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def query_indexes(filenames, **conditions):
+    """Yields the index filename and the summary of each matching hand."""
+    for filename in filenames:
+        index = poker_hands.HandIndex.load(filename)
+        for hand in index.query(**conditions):
+            yield filename, hand
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find hands in the indexes written by poker_hands.py --index.")
+    parser.add_argument('paths', nargs='+', help="Index files, directories or globs.")
+    parser.add_argument('--player', default=None, help="Only hands in which this player took part.")
+    parser.add_argument('--street', choices=poker_hands.STREETS, default=None,
+                        help="Only hands reaching at least this street, or in which the player did.")
+    parser.add_argument('--hand-class', choices=[hand_class.name for hand_class in poker_hands.HandClass],
+                        default=None, help="Only hands won at a showdown with this class of hand.")
+    parser.add_argument('--min-pot', type=int, default=None)
+    parser.add_argument('--max-pot', type=int, default=None)
+    parser.add_argument('--start', default=None, help="Only hands starting at or after this time, H:MM:SS.")
+    parser.add_argument('--end', default=None, help="Only hands starting at or before this time, H:MM:SS.")
+    arguments = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    filenames = index_filenames(arguments.paths)
+    matches = 0
+    for filename, hand in query_indexes(
+            filenames, player=arguments.player, street=arguments.street,
+            hand_class=arguments.hand_class, min_pot=arguments.min_pot,
+            max_pot=arguments.max_pot, start=arguments.start, end=arguments.end):
+        matches += 1
+        location = os.path.join(os.path.dirname(filename), hand['file'] or '')
+        print("{:<40} {:>8} {:>10} {:>8} {:<16} {}".format(
+            location, hand['number'], hand['starting_time'], hand['pot'],
+            hand['hand_class'] or '', hand['title']))
+    print("{} matching hand(s) in {} index(es), found in {:.3f}s.".format(
+        matches, len(filenames), time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
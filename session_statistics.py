@@ -0,0 +1,144 @@
+"""Per player statistics of a session, gathered in a single pass over the
+calculated hands, for example as they are yielded by read_poker_datafile, so
+that the memory used depends only on the number of players.
+
+The statistics of several files, or of the hands calculated by several
+processes, can be merged, see SessionStatistics.merge.
+"""
+
+
+class PlayerStatistics(object):
+    """The totals for one player.
+
+    `voluntary` counts the hands in which the player put chips in before the
+    flop other than the blinds, and `showdowns` those in which the player was
+    still in at the end of a hand which went to a showdown. `luck` is the
+    chips won at showdowns less those the player's equity entitled them to,
+    the equity being that after the last action of the hand, so this only
+    differs from zero for hands in which the players were all in before the
+    river."""
+    __slots__ = ('name', 'hands', 'net', 'voluntary', 'showdowns', 'showdowns_won', 'luck')
+
+    def __init__(self, name):
+        self.name = name
+        self.hands = 0
+        self.net = 0
+        self.voluntary = 0
+        self.showdowns = 0
+        self.showdowns_won = 0
+        self.luck = 0.0
+
+    def merge(self, other):
+        self.hands += other.hands
+        self.net += other.net
+        self.voluntary += other.voluntary
+        self.showdowns += other.showdowns
+        self.showdowns_won += other.showdowns_won
+        self.luck += other.luck
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values):
+        statistics = cls(values['name'])
+        for name in cls.__slots__:
+            setattr(statistics, name, values[name])
+        return statistics
+
+    @property
+    def voluntary_rate(self):
+        """The percentage of hands in which the player voluntarily put chips
+        in before the flop, usually known as VPIP."""
+        return 100 * self.voluntary / self.hands if self.hands else None
+
+    @property
+    def showdown_win_rate(self):
+        return 100 * self.showdowns_won / self.showdowns if self.showdowns else None
+
+
+class SessionStatistics(object):
+    def __init__(self):
+        self.players = {}
+        self.number_of_hands = 0
+        # Hands which could not be calculated are not included.
+        self.skipped_hands = 0
+
+    def player(self, name):
+        statistics = self.players.get(name)
+        if statistics is None:
+            statistics = self.players[name] = PlayerStatistics(name)
+        return statistics
+
+    def add_hand(self, hand):
+        taking_part = getattr(hand, 'taking_part', None)
+        if taking_part is None:
+            self.skipped_hands += 1
+            return
+        self.number_of_hands += 1
+        voluntary = set()
+        last_probabilities = None
+        preflop = True
+        for event in hand.events:
+            if event.action == 'BOARD':
+                preflop = False
+                continue
+            if preflop and event.action in ('CALL', 'ALL_IN') or preflop and event.action == 'BET' and event.amount:
+                voluntary.add(event.player)
+            if event.win_probabilities:
+                last_probabilities = event.win_probabilities
+
+        remaining = [player for player in taking_part if not player.folded]
+        showdown = len(remaining) > 1 and len(hand.flop) == 5
+        winners = [player for player in remaining if player.hand_winner]
+        pot = hand.events[-1].pot if hand.events else 0
+        for player in hand.players:
+            statistics = self.player(player.name)
+            statistics.hands += 1
+            statistics.net += player.ending_stack - player.starting_stack
+            if player.index in voluntary:
+                statistics.voluntary += 1
+            if not showdown or player not in remaining:
+                continue
+            statistics.showdowns += 1
+            won = int(pot / len(winners)) if player.hand_winner else 0
+            statistics.showdowns_won += bool(player.hand_winner)
+            if last_probabilities is not None and player.index in last_probabilities:
+                # Ties count as a win for each of the players tying, so the
+                # percentages may add up to more than 100.
+                total = sum(last_probabilities.values())
+                statistics.luck += won - pot * last_probabilities[player.index] / total
+
+    def add_hands(self, poker_hands):
+        """Adds each hand as it passes through."""
+        for hand in poker_hands:
+            self.add_hand(hand)
+            yield hand
+
+    def merge(self, other):
+        for name, statistics in other.players.items():
+            self.player(name).merge(statistics)
+        self.number_of_hands += other.number_of_hands
+        self.skipped_hands += other.skipped_hands
+
+    def as_dict(self):
+        """The statistics as json serialisable values, see from_dict."""
+        return {
+            'number_of_hands': self.number_of_hands,
+            'skipped_hands': self.skipped_hands,
+            'players': [statistics.as_dict() for statistics in self.players.values()],
+            }
+
+    @classmethod
+    def from_dict(cls, values):
+        session = cls()
+        session.number_of_hands = values['number_of_hands']
+        session.skipped_hands = values['skipped_hands']
+        for player_values in values['players']:
+            statistics = PlayerStatistics.from_dict(player_values)
+            session.players[statistics.name] = statistics
+        return session
+
+    def summary(self):
+        """The players' statistics, the biggest winners first."""
+        return sorted(self.players.values(), key=lambda statistics: (-statistics.net, statistics.name))
@@ -0,0 +1,162 @@
+"""Checks hand_strength against the evaluator it replaced, which tried each of
+the 21 five card hands in seven cards, over randomly sampled hands.
+
+Run from the root of the repository with:
+
+    python -m unittest discover tests
+"""
+from collections import defaultdict
+import random
+import unittest
+
+import poker_hands
+from poker_hands import HandClass
+
+
+class BaselineHandRank(object):
+    def __init__(self, rank, value_counts):
+        self.rank = rank
+        self.card_values = sorted([(count, value) for value, count in value_counts.items()], reverse=True)
+
+    def key(self):
+        return (self.rank, self.card_values)
+
+
+def baseline_best_hand(pocket, flop):
+    """The original best_hand, but for the two bugs which the table driven
+    evaluator deliberately fixes, each marked FIXED below."""
+    def get_value_counts(cards):
+        value_counts = defaultdict(int)
+        for value, _suit in cards:
+            value_counts[value] += 1
+        return value_counts
+
+    possible_hands = [
+        [flop[0], flop[1], flop[2], flop[3], flop[4]],
+        [pocket[0], flop[0], flop[1], flop[2], flop[3]],
+        [pocket[0], flop[0], flop[1], flop[2], flop[4]],
+        [pocket[0], flop[0], flop[1], flop[3], flop[4]],
+        [pocket[0], flop[0], flop[2], flop[3], flop[4]],
+        [pocket[0], flop[1], flop[2], flop[3], flop[4]],
+        [pocket[1], flop[0], flop[1], flop[2], flop[3]],
+        [pocket[1], flop[0], flop[1], flop[2], flop[4]],
+        [pocket[1], flop[0], flop[1], flop[3], flop[4]],
+        [pocket[1], flop[0], flop[2], flop[3], flop[4]],
+        [pocket[1], flop[1], flop[2], flop[3], flop[4]],
+        [pocket[0], pocket[1], flop[0], flop[1], flop[2]],
+        [pocket[0], pocket[1], flop[0], flop[1], flop[3]],
+        [pocket[0], pocket[1], flop[0], flop[2], flop[3]],
+        [pocket[0], pocket[1], flop[1], flop[2], flop[3]],
+        [pocket[0], pocket[1], flop[0], flop[1], flop[4]],
+        [pocket[0], pocket[1], flop[0], flop[2], flop[4]],
+        [pocket[0], pocket[1], flop[1], flop[2], flop[4]],
+        [pocket[0], pocket[1], flop[0], flop[3], flop[4]],
+        [pocket[0], pocket[1], flop[1], flop[3], flop[4]],
+        [pocket[0], pocket[1], flop[2], flop[3], flop[4]],
+        ]
+
+    def hand_rank(cards):
+        suits = set([suit for _v, suit in cards])
+        flush = len(suits) == 1
+        values = [value for value, _s in cards]
+        straight = False
+        wheel = False
+        for start in range(2, 11):
+            if all(i in values for i in range(start, start+5)):
+                straight = True
+                break
+        else:
+            straight = wheel = all(i in values for i in [14, 2, 3, 4, 5])
+
+        value_counts = get_value_counts(cards)
+        if wheel:
+            # FIXED: the ace of a wheel counts low, so it is a five high
+            # straight rather than beating every other straight.
+            value_counts = get_value_counts([(1 if value == 14 else value, suit) for value, suit in cards])
+
+        if flush and straight:
+            return BaselineHandRank(HandClass.straight_flush, value_counts)
+
+        card_counts = value_counts.values()
+        if 4 in card_counts:
+            return BaselineHandRank(HandClass.four_of_a_kind, value_counts)
+
+        if 3 in card_counts and 2 in card_counts:
+            return BaselineHandRank(HandClass.full_house, value_counts)
+
+        if flush:
+            return BaselineHandRank(HandClass.flush, value_counts)
+
+        if straight:
+            return BaselineHandRank(HandClass.straight, value_counts)
+
+        if 3 in card_counts:
+            return BaselineHandRank(HandClass.three_of_a_kind, value_counts)
+
+        if list(card_counts).count(2) == 2:
+            # FIXED: this was ranked as a pair.
+            return BaselineHandRank(HandClass.two_pair, value_counts)
+
+        if 2 in card_counts:
+            return BaselineHandRank(HandClass.pair, value_counts)
+
+        return BaselineHandRank(HandClass.high_card, value_counts)
+
+    return max([hand_rank(h) for h in possible_hands], key=BaselineHandRank.key)
+
+
+def strength(cards):
+    return poker_hands.hand_strength([poker_hands.encode_card(card) for card in cards])
+
+
+def compare(a, b):
+    return (a > b) - (a < b)
+
+
+def parse_cards(text):
+    return [poker_hands.parse_card(card) for card in text.split()]
+
+
+class EvaluatorTest(unittest.TestCase):
+    NUMBER_OF_HANDS = 5000
+
+    def random_deals(self, seed):
+        rng = random.Random(seed)
+        deck = poker_hands.new_deck()
+        for _ in range(self.NUMBER_OF_HANDS):
+            cards = rng.sample(deck, 9)
+            yield cards[:2], cards[2:4], cards[4:]
+
+    def test_hand_classes_agree(self):
+        for pocket, _other, flop in self.random_deals(1):
+            self.assertEqual(poker_hands.strength_hand_class(strength(pocket + flop)),
+                             baseline_best_hand(pocket, flop).rank, (pocket, flop))
+
+    def test_comparisons_agree(self):
+        """Two pockets on the same board are ordered in the same way, which is
+        what decides who wins a hand."""
+        for pocket, other, flop in self.random_deals(2):
+            expected = compare(baseline_best_hand(pocket, flop).key(), baseline_best_hand(other, flop).key())
+            actual = compare(strength(pocket + flop), strength(other + flop))
+            self.assertEqual(actual, expected, (pocket, other, flop))
+
+    def test_best_hand_matches_hand_strength(self):
+        for pocket, _other, flop in self.random_deals(3):
+            self.assertEqual(poker_hands.best_hand(pocket, flop).strength, strength(pocket + flop))
+
+    def test_two_pair_beats_a_pair(self):
+        flop = parse_cards('8c 8d 4h 4s 2c')
+        self.assertGreater(poker_hands.best_hand(parse_cards('7h 6d'), flop),
+                           poker_hands.best_hand(parse_cards('ah 3d'), parse_cards('ac 9d 4h 8s 2c')))
+        self.assertEqual(poker_hands.best_hand(parse_cards('7h 6d'), flop).rank, HandClass.two_pair)
+
+    def test_wheel_is_the_lowest_straight(self):
+        flop = parse_cards('2c 3d 4h 5s kc')
+        wheel = poker_hands.best_hand(parse_cards('ah qd'), flop)
+        six_high = poker_hands.best_hand(parse_cards('6h qd'), flop)
+        self.assertEqual(wheel.rank, HandClass.straight)
+        self.assertLess(wheel, six_high)
+
+
+if __name__ == '__main__':
+    unittest.main()